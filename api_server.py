@@ -0,0 +1,326 @@
+# api_server.py - Headless ASGI API over backend_rag
+#
+# Run:  uvicorn api_server:app --host 0.0.0.0 --port 8000 --workers 4
+# Workers share state through the SQLite files under YCOTES_DATA_DIR (chunk text,
+# dedup, jobs, study material, router vocabulary), so every worker must see the
+# same data directory. Scaling out across hosts therefore needs that directory on
+# a shared volume; a host with its own copy answers without the chunk text.
+import os
+import asyncio
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from study_gen import KINDS as STUDY_KINDS
+from ingest_jobs import QueueFull, get_job_queue
+from backend_rag import (
+    answer, answer_stream, generate_sub_questions, ingest_file, ingest_url, crawl_site, url_source,
+    CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, CRAWL_DEPTH_LIMIT, CRAWL_PAGES_LIMIT,
+    coalescing_stats, query_batcher, section_cache, generate_study_material
+)
+
+# ---------- Config ----------
+ANSWER_WORKERS = int(os.getenv("API_ANSWER_WORKERS", "8"))
+ANSWER_QUEUE_DEPTH = int(os.getenv("API_ANSWER_QUEUE_DEPTH", "32"))
+INGEST_WORKERS = int(os.getenv("API_INGEST_WORKERS", "2"))
+INGEST_QUEUE_DEPTH = int(os.getenv("API_INGEST_QUEUE_DEPTH", "8"))
+RETRY_AFTER_SEC = int(os.getenv("API_RETRY_AFTER_SEC", "2"))
+UPLOAD_READ_BYTES = 1 << 20
+
+_STREAM_END = object()
+
+
+# ---------- Worker Pools ----------
+class PoolSaturated(Exception):
+    def __init__(self, pool: str):
+        super().__init__(f"{pool} pool is saturated")
+        self.pool = pool
+
+
+class WorkerPool:
+    """Fixed set of worker threads plus a bounded wait queue.
+
+    At most `workers` jobs run at once and at most `queue_depth` more wait; anything
+    beyond that is rejected immediately with PoolSaturated (mapped to HTTP 429).
+    """
+
+    def __init__(self, name: str, workers: int, queue_depth: int):
+        self.name = name
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"api-{name}")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def check(self):
+        """Raise PoolSaturated if no slot is free right now.
+
+        Lets an endpoint turn a request away before expensive work such as
+        reading an upload; `run` still enforces the limit itself.
+        """
+        with self._lock:
+            if self.in_flight < self.capacity:
+                return
+            self.rejected += 1
+        raise PoolSaturated(self.name)
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PoolSaturated(self.name)
+        with self._lock:
+            self.admitted += 1
+            self.in_flight += 1
+
+    def _release(self, *_):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def run(self, fn: Callable, *args, **kwargs) -> "asyncio.Future":
+        """Run fn on the pool and return an awaitable for its result."""
+        self._admit()
+        ctx = contextvars.copy_context()
+        fut = self._executor.submit(ctx.run, fn, *args, **kwargs)
+        fut.add_done_callback(self._release)
+        return asyncio.wrap_future(fut)
+
+    def stream(self, gen_fn: Callable[..., Iterator[str]], *args, **kwargs) -> AsyncIterator[str]:
+        """Drive a blocking generator on the pool and expose it as an async iterator.
+
+        The slot is held until the generator is exhausted or the client goes away.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        out: "asyncio.Queue" = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for item in gen_fn(*args, **kwargs):
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(out.put_nowait, item)
+                loop.call_soon_threadsafe(out.put_nowait, _STREAM_END)
+            except Exception as e:
+                loop.call_soon_threadsafe(out.put_nowait, e)
+
+        ctx = contextvars.copy_context()
+        fut = self._executor.submit(ctx.run, produce)
+        fut.add_done_callback(self._release)
+
+        async def consume():
+            try:
+                while True:
+                    item = await out.get()
+                    if item is _STREAM_END:
+                        return
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                cancelled.set()
+
+        return consume()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+answer_pool = WorkerPool("answer", ANSWER_WORKERS, ANSWER_QUEUE_DEPTH)
+ingest_pool = WorkerPool("ingest", INGEST_WORKERS, INGEST_QUEUE_DEPTH)
+
+app = FastAPI(title="Ycotes RAG API")
+
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(RETRY_AFTER_SEC)},
+    )
+
+
+@app.exception_handler(QueueFull)
+async def job_queue_full_handler(request: Request, exc: QueueFull):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(RETRY_AFTER_SEC)},
+    )
+
+
+# ---------- Schemas ----------
+class AnswerRequest(BaseModel):
+    question: str = Field(min_length=1)
+    style: str = "concise"
+    lang: str = "en"
+    stream: bool = False
+    session_id: Optional[str] = None
+
+
+class AnswerResponse(BaseModel):
+    answer: str
+
+
+class SocraticRequest(BaseModel):
+    question: str = Field(min_length=1)
+    lang: str = "en"
+
+
+class SocraticResponse(BaseModel):
+    questions: List[str]
+
+
+class IngestUrlRequest(BaseModel):
+    url: str
+    crawl: bool = False
+    max_depth: int = Field(CRAWL_MAX_DEPTH, ge=1, le=CRAWL_DEPTH_LIMIT)
+    max_pages: int = Field(CRAWL_MAX_PAGES, ge=1, le=CRAWL_PAGES_LIMIT)
+    background: bool = False
+
+
+class IngestResponse(BaseModel):
+    source: str
+    chunks: int
+
+
+class JobAccepted(BaseModel):
+    job_id: str
+    source: str
+
+
+class StudyRequest(BaseModel):
+    source: str
+    kind: str = "notes"
+    lang: str = "en"
+    force: bool = False
+
+
+class StudyResponse(BaseModel):
+    source: str
+    kind: str
+    content: str
+    stats: Dict[str, Any]
+
+
+# ---------- Endpoints ----------
+@app.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "pools": {"answer": answer_pool.stats(), "ingest": ingest_pool.stats()},
+        "coalescing": coalescing_stats(),
+        "embed_batching": query_batcher.stats(),
+        "section_cache": section_cache.stats(),
+        "ingest_jobs": get_job_queue().stats(),
+    }
+
+
+@app.post("/answer", response_model=AnswerResponse)
+async def answer_endpoint(req: AnswerRequest):
+    if req.stream:
+        chunks = answer_pool.stream(answer_stream, req.question, style=req.style, lang=req.lang,
+                                    session_id=req.session_id)
+        return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+    text = await answer_pool.run(answer, req.question, style=req.style, lang=req.lang, session_id=req.session_id)
+    return AnswerResponse(answer=text)
+
+
+@app.post("/socratic", response_model=SocraticResponse)
+async def socratic_endpoint(req: SocraticRequest):
+    questions = await answer_pool.run(generate_sub_questions, req.question, req.lang)
+    return SocraticResponse(questions=questions)
+
+
+@app.post("/ingest/file", response_model=IngestResponse, responses={202: {"model": JobAccepted}})
+async def ingest_file_endpoint(file: UploadFile = File(...), source: Optional[str] = Form(None),
+                               background: bool = Form(False)):
+    source = source or f"file_{file.filename}"
+    # Before the body is read, so a saturated service rejects cheaply
+    if background:
+        get_job_queue().check()
+    else:
+        ingest_pool.check()
+    suffix = os.path.splitext(file.filename or "")[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        while True:
+            block = await file.read(UPLOAD_READ_BYTES)
+            if not block:
+                break
+            tmp.write(block)
+        tmp_path = tmp.name
+    if background:
+        try:
+            job_id = get_job_queue().submit("file", file.filename or source, source, ingest_file, tmp_path, source,
+                                            on_finish=lambda job: os.unlink(tmp_path))
+        except QueueFull:
+            os.unlink(tmp_path)
+            raise
+        return JSONResponse(status_code=202, content={"job_id": job_id, "source": source})
+    try:
+        n_chunks = await ingest_pool.run(ingest_file, tmp_path, source)
+    finally:
+        os.unlink(tmp_path)
+    return IngestResponse(source=source, chunks=n_chunks)
+
+
+@app.post("/ingest/url", response_model=IngestResponse, responses={202: {"model": JobAccepted}})
+async def ingest_url_endpoint(req: IngestUrlRequest):
+    if not req.url.startswith(("http://", "https://")):
+        return JSONResponse(status_code=400, content={"detail": "URL must start with http:// or https://"})
+    source = url_source(req.url)
+    if req.background:
+        jobs = get_job_queue()
+        if req.crawl:
+            job_id = jobs.submit("crawl", req.url, source, crawl_site, req.url, req.max_depth, req.max_pages)
+        else:
+            job_id = jobs.submit("url", req.url, source, ingest_url, req.url)
+        return JSONResponse(status_code=202, content={"job_id": job_id, "source": source})
+    if req.crawl:
+        n_chunks = await ingest_pool.run(crawl_site, req.url, req.max_depth, req.max_pages)
+    else:
+        n_chunks = await ingest_pool.run(ingest_url, req.url)
+    return IngestResponse(source=source, chunks=n_chunks)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown job '{job_id}'"})
+    return asdict(job)
+
+
+@app.post("/study", response_model=StudyResponse)
+async def study_endpoint(req: StudyRequest):
+    if req.kind not in STUDY_KINDS:
+        return JSONResponse(status_code=400, content={"detail": f"kind must be one of {', '.join(STUDY_KINDS)}"})
+    content, stats = await ingest_pool.run(generate_study_material, req.source, req.kind, req.lang, req.force)
+    if not content:
+        return JSONResponse(status_code=404, content={"detail": f"No ingested chunks for source '{req.source}'"})
+    return StudyResponse(source=req.source, kind=req.kind, content=content, stats=asdict(stats))
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", "8000")))
@@ -9,14 +9,17 @@ from typing import List, Dict, Optional
 import requests
 import io
 import threading
-from urllib.parse import urlparse
 
 # Import backend functionality (your existing module)
 from backend_rag import (
-    chunk_by_topic, extract_text_from_file, scrape_url,
-    upsert_chunks, answer, generate_sub_questions,
-    EMBED_MODEL, CHAT_MODEL
+    answer, generate_sub_questions, ingest_file, ingest_url, crawl_site, url_source,
+    generate_study_material,
+    CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, CRAWL_DEPTH_LIMIT, CRAWL_PAGES_LIMIT,
+    EMBED_MODEL, CHAT_MODEL, USD_TO_INR, cost_sink
 )
+from chat_store import get_store
+from ingest_jobs import QueueFull, get_job_queue
+from profiling import PROFILE_ENABLED, profiling_enabled, profile_session, profile_block, profiled, recent_reports
 
 # Optional TTS libraries
 try:
@@ -47,6 +50,10 @@ st.set_page_config(
 )
 
 # ---------- Session State Initialization ----------
+MAX_TURNS_IN_MEMORY = 60   # older turns stay in the chat store until paged back in
+SOCRATIC_KEYS = ("socratic_questions", "selected_questions", "main_question", "socratic_lang", "socratic_style")
+JOB_REFRESH_SEC = 2        # how often the ingest job panel polls while the page is open
+
 def initialize_session_state():
     """Initialize all session state variables"""
     defaults = {
@@ -63,11 +70,73 @@ def initialize_session_state():
         'voice_transcript': "",
         'processing_state': "idle",
         'language': 'English',
-        'response_style': 'Concise'
+        'response_style': 'Concise',
+        'session_id': None,
+        'history_has_more': False,
+        'study_material': None,
+        'profiling': PROFILE_ENABLED
     }
     for key, value in defaults.items():
         if key not in st.session_state:
             st.session_state[key] = value
+    restore_session()
+
+# ---------- Session Persistence ----------
+def restore_session():
+    """Bind this tab to a persisted session (?sid=...) and restore its latest page of history."""
+    if st.session_state.session_id:
+        return
+    store = get_store()
+    sid = st.query_params.get("sid")
+    saved = store.load_session(sid) if sid else None
+    if saved is None:
+        if sid:
+            store.ensure_session(sid)
+        else:
+            sid = store.create_session()
+            st.query_params["sid"] = sid
+    else:
+        turns, has_more = store.load_turns(sid)
+        st.session_state.chat_history = turns
+        st.session_state.history_has_more = has_more
+        st.session_state.uploaded_files = saved["uploaded_files"]
+        socratic = store.load_socratic(sid) or {}
+        for key in SOCRATIC_KEYS:
+            if key in socratic:
+                st.session_state[key] = socratic[key]
+    st.session_state.session_id = sid
+
+def add_turn(turn: Dict):
+    """Append a turn to the visible history and persist it; trim what is held in memory."""
+    history = st.session_state.chat_history
+    history.append(turn)
+    get_store().append_turn(st.session_state.session_id, turn)
+    overflow = len(history) - MAX_TURNS_IN_MEMORY
+    if overflow > 0:
+        del history[:overflow]
+        st.session_state.history_has_more = True
+
+def load_earlier_turns():
+    history = st.session_state.chat_history
+    store, sid = get_store(), st.session_state.session_id
+    before_id = history[0].get("id") if history else None
+    if history and before_id is None:
+        # Appended during this session: its row ID is assigned by the store's background writer
+        store.flush()
+        before_id = store.turn_id(sid, history[0]["timestamp"])
+    turns, has_more = store.load_turns(sid, before_id=before_id)
+    st.session_state.chat_history = turns + history
+    st.session_state.history_has_more = has_more
+
+def save_socratic_state():
+    state = {key: st.session_state.get(key) for key in SOCRATIC_KEYS}
+    get_store().save_socratic(st.session_state.session_id, state)
+
+def track_session_costs():
+    """Attribute embedding/chat spend made during this script run to the current session."""
+    sid = st.session_state.session_id
+    store = get_store()
+    cost_sink.set(lambda kind, tin, tout, usd: store.record_cost(sid, kind, tin, tout, usd))
 
 # ---------- Custom CSS with Animations ----------
 def local_css():
@@ -196,6 +265,7 @@ def synthesize_with_gtts(text: str, lang_code: str = "en") -> Optional[bytes]:
         st.write(f"gTTS synth error: {e}")
         return None
 
+@profiled("synthesize_speech")
 def synthesize_speech(text: str, language_code: str = "en-US") -> Optional[bytes]:
     """Unified TTS: try pyttsx3 (offline) first, then gTTS fallback."""
     # Normalize to 'hi' or 'en' token for our helpers
@@ -291,16 +361,31 @@ def render_sidebar():
         st.markdown("### 🧠 Model Info")
         st.write(f"**Chat Model:** {CHAT_MODEL}")
         st.write(f"**Embed Model:** {EMBED_MODEL}")
+        spend = get_store().session_cost(st.session_state.session_id)
+        st.write(f"**Session Cost:** ${spend['usd']:.4f} (₹{spend['usd'] * USD_TO_INR:.2f})")
 
         st.markdown("---")
         st.markdown("### ⚡ Quick Actions")
         if st.button("Clear Chat History", use_container_width=True):
             st.session_state.chat_history = []
+            st.session_state.history_has_more = False
+            get_store().clear_turns(st.session_state.session_id)
             st.session_state.avatar_state = "idle"
             st.rerun()
         if st.button("Upload Document", use_container_width=True):
             st.session_state.show_upload = True
             st.rerun()
+        render_ingest_jobs()
+
+        st.markdown("---")
+        st.markdown("### 🔬 Diagnostics")
+        st.checkbox("Profile requests", key="profiling",
+                    help="Sample answer, ingestion, TTS and page rendering; writes flame graphs per request")
+        if st.session_state.profiling:
+            for report in recent_reports(st.session_state.session_id)[:3]:
+                with st.expander(f"{report.name}: {report.elapsed_ms:.0f} ms"):
+                    st.code("\n".join(report.top[:10]))
+                    st.caption(report.files[0])
 
 def render_header():
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -342,6 +427,11 @@ def render_chat_interface():
     render_ai_avatar_block()
     st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
+    if st.session_state.history_has_more:
+        if st.button("⬆️ Load earlier messages", use_container_width=True):
+            load_earlier_turns()
+            st.rerun()
+
     # Display chat history
     for i, chat in enumerate(st.session_state.chat_history):
         if chat["role"] == "user":
@@ -419,8 +509,8 @@ def render_chat_interface():
 def render_upload_interface():
     st.markdown("### 📁 Document Upload")
     uploaded_file = st.file_uploader(
-        "Upload PDF, TXT, DOCX, or CSV files",
-        type=['pdf', 'txt', 'docx', 'csv'],
+        "Upload PDF, TXT, DOCX, CSV or TSV files",
+        type=['pdf', 'txt', 'docx', 'csv', 'tsv'],
         accept_multiple_files=False,
         key="file_uploader"
     )
@@ -434,47 +524,134 @@ def render_upload_interface():
                 st.rerun()
     st.markdown("### 🌐 Web Content")
     url = st.text_input("Enter URL to scrape:", placeholder="https://example.com", key="url_input")
+    crawl = st.checkbox("Follow links on the same site", value=False, key="crawl_site")
+    max_depth, max_pages = CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES
+    if crawl:
+        col1, col2 = st.columns(2)
+        with col1:
+            max_depth = st.number_input("Link depth", min_value=1, max_value=CRAWL_DEPTH_LIMIT,
+                                        value=CRAWL_MAX_DEPTH)
+        with col2:
+            max_pages = st.number_input("Max pages", min_value=1, max_value=CRAWL_PAGES_LIMIT,
+                                        value=CRAWL_MAX_PAGES)
     if st.button("🌐 Scrape Website", use_container_width=True):
-        process_url(url)
+        process_url(url, crawl=crawl, max_depth=int(max_depth), max_pages=int(max_pages))
         st.rerun()
+    render_study_material()
     if st.button("← Back to Chat", use_container_width=True):
         st.session_state.show_upload = False
         st.rerun()
 
-def process_uploaded_file(uploaded_file):
-    with st.spinner("🔄 Processing document..."):
+def render_study_material():
+    st.markdown("### 📝 Study Material")
+    if not st.session_state.uploaded_files:
+        st.caption("Process a document to generate notes, a summary or a quiz from it.")
+        return
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        filename = st.selectbox("Document", st.session_state.uploaded_files, key="study_file")
+    with col2:
+        kind = st.selectbox("Type", ["notes", "summary", "quiz"], key="study_kind")
+    lang_code = "hi" if st.session_state.language == "Hindi" else "en"
+    col1, col2 = st.columns(2)
+    with col1:
+        generate = st.button("📝 Generate", use_container_width=True)
+    with col2:
+        regenerate = st.button("🔁 Regenerate", use_container_width=True)
+    if generate or regenerate:
+        progress = st.progress(0.0, text=f"Generating {kind}...")
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            text = extract_text_from_file(tmp_path)
-            if text.strip():
-                chunks = chunk_by_topic(text)
-                upsert_chunks(chunks, source=f"file_{uploaded_file.name}")
-                st.success(f"✅ Successfully processed {len(chunks)} chunks from {uploaded_file.name}")
-                st.session_state.uploaded_files.append(uploaded_file.name)
+            content, stats = generate_study_material(
+                f"file_{filename}", kind, lang_code, force=regenerate,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Generating {kind}... {done}/{total}")
+            )
+            st.session_state.study_material = {"file": filename, "kind": kind, "content": content}
+            if stats.from_artifact:
+                st.caption("Loaded saved copy (document unchanged).")
             else:
-                st.error("❌ No text could be extracted from the file")
-            os.unlink(tmp_path)
+                st.caption(f"{stats.chunks} chunks · {stats.map_calls + stats.reduce_calls} LLM calls · "
+                           f"{stats.map_cached + stats.reduce_cached} reused · {stats.elapsed_sec:.1f}s")
         except Exception as e:
-            st.error(f"❌ Error processing file: {e}")
+            st.error(f"❌ Error generating {kind}: {e}")
+        finally:
+            progress.empty()
+    material = st.session_state.study_material
+    if material and material["content"]:
+        st.markdown(f"#### {material['kind'].title()}: {material['file']}")
+        st.markdown(material["content"])
+        st.download_button("⬇️ Download", material["content"], file_name=f"{material['file']}_{material['kind']}.md",
+                           mime="text/markdown")
+    elif material:
+        st.error("❌ No processed text found for this document")
 
-def process_url(url):
+def process_uploaded_file(uploaded_file):
+    """Queue the upload for background ingestion; the chat stays usable meanwhile."""
+    try:
+        get_job_queue().check()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
+            tmp_file.write(uploaded_file.getvalue())
+            tmp_path = tmp_file.name
+        try:
+            get_job_queue().submit(
+                "file", uploaded_file.name, f"file_{uploaded_file.name}", ingest_file, tmp_path,
+                f"file_{uploaded_file.name}", session_id=st.session_state.session_id,
+                on_finish=lambda job: os.unlink(tmp_path)
+            )
+        except QueueFull:
+            os.unlink(tmp_path)
+            raise
+        st.toast(f"📥 Processing {uploaded_file.name} in the background — you can keep chatting.")
+    except QueueFull as e:
+        st.warning(f"⏳ {e}")
+    except Exception as e:
+        st.error(f"❌ Error processing file: {e}")
+
+def process_url(url, crawl: bool = False, max_depth: int = CRAWL_MAX_DEPTH, max_pages: int = CRAWL_MAX_PAGES):
     if url and url.startswith(('http://', 'https://')):
-        with st.spinner("🔄 Scraping website content..."):
-            try:
-                text = scrape_url(url)
-                if text.strip():
-                    chunks = chunk_by_topic(text)
-                    upsert_chunks(chunks, source=f"url_{urlparse(url).netloc}")
-                    st.success(f"✅ Successfully processed {len(chunks)} chunks from {url}")
-                else:
-                    st.error("❌ No content could be scraped from the URL")
-            except Exception as e:
-                st.error(f"❌ Error scraping URL: {e}")
+        source = url_source(url)
+        try:
+            if crawl:
+                get_job_queue().submit("crawl", url, source, crawl_site, url, max_depth, max_pages,
+                                       session_id=st.session_state.session_id)
+            else:
+                get_job_queue().submit("url", url, source, ingest_url, url, session_id=st.session_state.session_id)
+        except QueueFull as e:
+            st.warning(f"⏳ {e}")
+            return
+        st.toast(f"📥 Scraping {url} in the background — you can keep chatting.")
     else:
         st.error("❌ Please enter a valid URL")
 
+def render_ingest_jobs():
+    """Progress of this session's background ingest jobs."""
+    jobs = get_job_queue().list_jobs(st.session_state.session_id, limit=5)
+    if not jobs:
+        return
+    st.markdown("### 📥 Ingestion")
+    for job in jobs:
+        name = job.label if len(job.label) <= 40 else job.label[:37] + "..."
+        counts = f"{job.pages} pages · {job.chunks} chunks · {job.tokens:,} tokens · ${job.cost_usd:.4f}"
+        if job.active:
+            st.info(f"⏳ **{name}** ({job.status})\n\n{counts}")
+        elif job.status == "done" and job.result:
+            st.success(f"✅ **{name}**\n\n{counts}")
+        elif job.status == "done":
+            st.warning(f"⚠️ **{name}**: no new content (no text, or all duplicates of indexed material)")
+        else:
+            st.error(f"❌ **{name}** {job.status}: {job.error or 'unknown error'}")
+
+    # Finished uploads become available for study material once, however many reruns see them
+    finished = [j.label for j in jobs if j.kind == "file" and j.status == "done" and j.result
+                and j.label not in st.session_state.uploaded_files]
+    if finished:
+        st.session_state.uploaded_files.extend(finished)
+        get_store().save_uploaded_files(st.session_state.session_id, st.session_state.uploaded_files)
+        st.rerun()
+
+if hasattr(st, "fragment"):
+    # Poll in place so progress updates without rerunning (or interrupting) the chat
+    render_ingest_jobs = st.fragment(run_every=JOB_REFRESH_SEC)(render_ingest_jobs)
+
 def process_question(question: str, mode: str = "standard"):
     """Process user question"""
     lang_code = "hi" if st.session_state.language == "Hindi" else "en"
@@ -485,7 +662,7 @@ def process_question(question: str, mode: str = "standard"):
         "Beginner Friendly": "beginner"
     }
     style = style_map.get(st.session_state.response_style, "concise")
-    st.session_state.chat_history.append({
+    add_turn({
         "role": "user",
         "content": question,
         "timestamp": time.time()
@@ -494,9 +671,9 @@ def process_question(question: str, mode: str = "standard"):
     with st.spinner("🤔 Thinking..."):
         try:
             if mode == "standard":
-                answer_text = answer(question, style=style, lang=lang_code)
+                answer_text = answer(question, style=style, lang=lang_code, session_id=st.session_state.session_id)
                 st.session_state.current_answer = answer_text
-                st.session_state.chat_history.append({
+                add_turn({
                     "role": "assistant",
                     "content": answer_text,
                     "type": "answer",
@@ -532,6 +709,7 @@ def process_question(question: str, mode: str = "standard"):
                 st.session_state.socratic_lang = lang_code
                 st.session_state.socratic_style = style
                 st.session_state.selected_questions = []
+                save_socratic_state()
                 st.session_state.avatar_state = "idle"
         except Exception as e:
             st.error(f"❌ Error processing question: {e}")
@@ -556,11 +734,13 @@ def render_socratic_interface():
 def explain_socratic_question(question: str, index: int):
     if question not in st.session_state.selected_questions:
         st.session_state.selected_questions.append(question)
+        save_socratic_state()
     st.session_state.avatar_state = "thinking"
     with st.spinner(f"Explaining: {question}"):
         try:
-            answer_text = answer(question, style=st.session_state.socratic_style, lang=st.session_state.socratic_lang)
-            st.session_state.chat_history.append({
+            answer_text = answer(question, style=st.session_state.socratic_style, lang=st.session_state.socratic_lang,
+                                 session_id=st.session_state.session_id)
+            add_turn({
                 "role": "assistant",
                 "content": f"**{question}**\n\n{answer_text}",
                 "type": "socratic_explanation",
@@ -590,8 +770,9 @@ def synthesize_socratic_answer():
     st.session_state.avatar_state = "thinking"
     with st.spinner("🎯 Synthesizing final answer..."):
         try:
-            final_answer = answer(st.session_state.main_question, style=st.session_state.socratic_style, lang=st.session_state.socratic_lang)
-            st.session_state.chat_history.append({
+            final_answer = answer(st.session_state.main_question, style=st.session_state.socratic_style,
+                                  lang=st.session_state.socratic_lang, session_id=st.session_state.session_id)
+            add_turn({
                 "role": "assistant",
                 "content": f"**Final Answer: {st.session_state.main_question}**\n\n{final_answer}",
                 "type": "socratic_final",
@@ -616,6 +797,7 @@ def synthesize_socratic_answer():
                 st.session_state.avatar_state = "idle"
             st.session_state.socratic_questions = []
             st.session_state.selected_questions = []
+            save_socratic_state()
         except Exception as e:
             st.error(f"❌ Error synthesizing answer: {e}")
             st.session_state.avatar_state = "idle"
@@ -623,15 +805,19 @@ def synthesize_socratic_answer():
 # ---------- Main App ----------
 def main():
     initialize_session_state()
-    local_css()
-    render_header()
-    render_sidebar()
-    if st.session_state.show_upload:
-        render_upload_interface()
-    else:
-        render_chat_interface()
-        if st.session_state.socratic_questions:
-            render_socratic_interface()
+    track_session_costs()
+    profiling_enabled.set(st.session_state.profiling)
+    profile_session.set(st.session_state.session_id)
+    with profile_block("streamlit_run"):
+        local_css()
+        render_header()
+        render_sidebar()
+        if st.session_state.show_upload:
+            render_upload_interface()
+        else:
+            render_chat_interface()
+            if st.session_state.socratic_questions:
+                render_socratic_interface()
 
 if __name__ == "__main__":
     main()
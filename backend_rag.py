@@ -3,12 +3,30 @@ import os
 import re
 import time
 import json
-from typing import List, Dict, Tuple, Optional
+import threading
+import contextvars
+from typing import List, Dict, Tuple, Optional, Callable, Iterable, Iterator
 from urllib.parse import urlparse  # FIXED: Added import
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from openai import OpenAI
 
+# Load .env before the local modules below (and the config block) read their settings
+load_dotenv()
+
+from singleflight import SingleFlight, normalize_text
+from embed_batcher import EmbeddingBatcher
+from docstore import DocStore, DOCSTORE_PATH
+from tabular_ingest import is_tabular, iter_table_chunks
+from dedup import DedupIndex, DEDUP_DB_PATH
+from storage import DATA_DIR
+from crawler import SiteCrawler, CrawledPage, html_to_text
+from query_router import CorpusVocabulary, QueryRouter, RouteDecision
+from hierarchy import SectionCache, SectionCentroids, split_section, SECTION_CHUNK_CHARS
+from study_gen import StudyGenerator, StudyStore, RateLimiter, GenerationStats, OutputTruncated
+from ingest_jobs import report_progress
+from profiling import profiled
+
 # Try different Pinecone import approaches
 try:
     # New Pinecone SDK (v3+)
@@ -43,25 +61,72 @@ except ImportError:
 # ---------- Config ----------
 INDEX_NAME = "ycotes-rag"
 NAMESPACE = "default"
-DIMENSION = 1536
+EMBED_NATIVE_DIMENSION = 1536
+# Shortened embeddings: text-embedding-3 models accept a `dimensions` parameter.
+# The Pinecone index must be created with the same dimension.
+DIMENSION = int(os.getenv("EMBED_DIMENSIONS", str(EMBED_NATIVE_DIMENSION)))
 METRIC = "cosine"
 REGION = "us-east-1"
 EMBED_MODEL = "text-embedding-3-small"
 CHAT_MODEL = "gpt-4o"
+FAST_CHAT_MODEL = os.getenv("FAST_CHAT_MODEL", "gpt-4o-mini")
 
 # Pricing
 USD_TO_INR = 84.0
 USD_PER_TOKEN_EMBED = 0.02 / 1_000_000.0
 USD_PER_TOKEN_CHAT_IN = 5.0 / 1_000_000.0
 USD_PER_TOKEN_CHAT_OUT = 15.0 / 1_000_000.0
+# (input, output) USD per token for models other than CHAT_MODEL
+CHAT_MODEL_PRICES = {
+    "gpt-4o-mini": (0.15 / 1_000_000.0, 0.60 / 1_000_000.0),
+}
 
 TOP_K = 6
 MIN_SCORE = 0.25
 MAX_CONTEXT_CHARS = 7000
 DEFAULT_TTL_HOURS = 24 * 7
+MAX_CHUNK_CHARS = 10000
+UPSERT_BATCH = 64           # chunks embedded and upserted per request
+TABLE_UPSERT_CHUNKS = 256   # table chunks buffered between incremental upserts
+
+# Near-duplicate detection at ingest: "skip" drops the duplicate and records its source
+# as an alias, "merge" also adds it to the canonical vector's metadata, "off" disables it.
+DEDUP_MODE = os.getenv("DEDUP_MODE", "skip")
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+# Site crawling
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", "2"))
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "50"))
+CRAWL_DEPTH_LIMIT = 5      # most a user may ask for, in the UI or the API
+CRAWL_PAGES_LIMIT = 500
+CRAWL_WORKERS = int(os.getenv("CRAWL_WORKERS", "4"))
+CRAWL_CACHE_DIR = os.getenv("CRAWL_CACHE_DIR", os.path.join(DATA_DIR, "http_cache"))
+
+# Retrieval backend: "pinecone" (live index) or "local" (memory-mapped snapshot, see index_snapshot.py)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone")
+INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "")
+LOCAL_QUANTIZATION = os.getenv("LOCAL_QUANTIZATION", "int8")
+
+# Two-level retrieval: "hierarchical" ranks section summary vectors first, then searches only
+# those sections' chunks (Pinecone backend only). Section vectors are written at ingest in either mode.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "flat")
+SECTION_NAMESPACE = f"{NAMESPACE}-sections"
+SECTION_TOP_K = int(os.getenv("SECTION_TOP_K", "3"))
+LEGACY_CHECK_SEC = 600     # how often to re-check for chunks that have no section vector
+
+# Query routing: skip retrieval / use FAST_CHAT_MODEL when a question allows it
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+
+# Study material map-reduce: per-chunk calls on FAST_CHAT_MODEL, merges on CHAT_MODEL
+STUDY_GEN_WORKERS = int(os.getenv("STUDY_GEN_WORKERS", "8"))
+STUDY_GEN_RPM = int(os.getenv("STUDY_GEN_RPM", "500"))
+STUDY_GEN_TPM = int(os.getenv("STUDY_GEN_TPM", "200000"))
+
+# Query embedding micro-batching (window 0 disables it)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "10"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
 
 # ---------- Init ----------
-load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
@@ -78,6 +143,14 @@ if PINECONE_NEW:
 else:
     pinecone.init(api_key=PINECONE_API_KEY)
 
+def check_index_dimension(index_dimension: int):
+    """An index built at another dimension would reject every upsert and query."""
+    if int(index_dimension) != DIMENSION:
+        raise ValueError(
+            f"Pinecone index '{INDEX_NAME}' has dimension {index_dimension} but EMBED_DIMENSIONS={DIMENSION}. "
+            f"Set EMBED_DIMENSIONS={index_dimension}, or re-embed into a new index (see index_snapshot.py)."
+        )
+
 def get_pinecone_index():
     """Get Pinecone index with version compatibility"""
     if PINECONE_NEW:
@@ -96,6 +169,8 @@ def get_pinecone_index():
             # Wait for index to be ready
             while not pc.describe_index(INDEX_NAME).status.ready:
                 time.sleep(1)
+        else:
+            check_index_dimension(pc.describe_index(INDEX_NAME).dimension)
         
         return pc.Index(INDEX_NAME)
     else:
@@ -107,13 +182,75 @@ def get_pinecone_index():
                 dimension=DIMENSION,
                 metric=METRIC
             )
+        else:
+            check_index_dimension(pinecone.describe_index(INDEX_NAME).dimension)
         
         return pinecone.Index(INDEX_NAME)
 
 # Initialize index
 index = get_pinecone_index()
 
+_local_index = None
+_local_index_lock = threading.Lock()
+
+if RETRIEVAL_BACKEND == "local" and RETRIEVAL_MODE == "hierarchical":
+    print("⚠️ RETRIEVAL_MODE=hierarchical is not supported with RETRIEVAL_BACKEND=local; the snapshot is searched flat")
+
+def get_local_index():
+    """Lazily open the configured snapshot as an in-process index (shared by all threads)."""
+    global _local_index
+    with _local_index_lock:
+        if _local_index is None:
+            if not INDEX_SNAPSHOT_PATH:
+                raise ValueError("Set INDEX_SNAPSHOT_PATH to use RETRIEVAL_BACKEND=local")
+            from index_snapshot import load_snapshot
+            _local_index = load_snapshot(INDEX_SNAPSHOT_PATH, expected_model=EMBED_MODEL,
+                                         expected_dimension=DIMENSION, quantization=LOCAL_QUANTIZATION)
+        return _local_index
+
+_docstore = None
+_docstore_lock = threading.Lock()
+
+def get_docstore() -> DocStore:
+    """Chunk text store. Local replicas read the copy shipped inside their snapshot."""
+    global _docstore
+    with _docstore_lock:
+        if _docstore is None:
+            path = DOCSTORE_PATH
+            snapshot_docs = os.path.join(INDEX_SNAPSHOT_PATH, "docstore.db") if INDEX_SNAPSHOT_PATH else ""
+            if RETRIEVAL_BACKEND == "local" and not os.getenv("YCOTES_DOCSTORE") and os.path.exists(snapshot_docs):
+                path = snapshot_docs
+            _docstore = DocStore(path)
+        return _docstore
+
+_dedup_index = None
+_dedup_lock = threading.Lock()
+router = QueryRouter(strong_model=CHAT_MODEL, fast_model=FAST_CHAT_MODEL,
+                     vocab=CorpusVocabulary(docstore=get_docstore()))
+
+def get_dedup_index() -> DedupIndex:
+    global _dedup_index
+    with _dedup_lock:
+        if _dedup_index is None:
+            _dedup_index = DedupIndex(DEDUP_DB_PATH, threshold=DEDUP_THRESHOLD)
+        return _dedup_index
+
 # ---------- Cost Helpers ----------
+# Callers (a UI session, an API request, an ingest job) set this to
+# fn(kind, tokens_in, tokens_out, usd) to attribute spend to themselves.
+cost_sink: contextvars.ContextVar[Optional[Callable[[str, int, int, float], None]]] = \
+    contextvars.ContextVar("cost_sink", default=None)
+
+def report_cost(kind: str, tokens_in: int, tokens_out: int, usd: float):
+    report_progress(tokens=tokens_in + tokens_out, cost_usd=usd)
+    sink = cost_sink.get()
+    if sink is None:
+        return
+    try:
+        sink(kind, tokens_in, tokens_out, usd)
+    except Exception as e:
+        print(f"⚠️ Cost sink failed: {e}")
+
 def cost_usd_to_inr(usd): 
     return usd * USD_TO_INR
 
@@ -121,22 +258,69 @@ def print_embed_cost(tokens: int):
     usd = tokens * USD_PER_TOKEN_EMBED
     inr = cost_usd_to_inr(usd)
     print(f" 🧠 Embedding tokens: {tokens} | 💵 ${usd:.8f} | ₹{inr:.6f}")
+    report_cost("embed", tokens, 0, usd)
     return usd, inr
 
-def print_chat_cost(in_t: int, out_t: int):
-    usd = in_t * USD_PER_TOKEN_CHAT_IN + out_t * USD_PER_TOKEN_CHAT_OUT
+def print_chat_cost(in_t: int, out_t: int, model: str = CHAT_MODEL):
+    price_in, price_out = CHAT_MODEL_PRICES.get(model, (USD_PER_TOKEN_CHAT_IN, USD_PER_TOKEN_CHAT_OUT))
+    usd = in_t * price_in + out_t * price_out
     inr = cost_usd_to_inr(usd)
     print(f" 💬 Tokens in={in_t} out={out_t} | 💵 ${usd:.6f} | ₹{inr:.4f}")
+    report_cost("chat", in_t, out_t, usd)
     return usd, inr
 
+# ---------- Request Coalescing ----------
+# Concurrent identical embed/retrieve/LLM calls (e.g. a whole class asking the
+# same question at once) share one in-flight upstream request.
+embed_flight = SingleFlight("embed")
+retrieve_flight = SingleFlight("retrieve")
+llm_flight = SingleFlight("llm")
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    return {f.name: f.stats() for f in (embed_flight, retrieve_flight, llm_flight)}
+
 # ---------- Embedding ----------
-def embed_text(text: str) -> Tuple[List[float], int]:
-    r = oa.embeddings.create(model=EMBED_MODEL, input=text)
+def embed_request(inputs) -> Dict:
+    kwargs = {"model": EMBED_MODEL, "input": inputs}
+    if DIMENSION != EMBED_NATIVE_DIMENSION:
+        kwargs["dimensions"] = DIMENSION
+    return kwargs
+
+def _embed_text(text: str) -> Tuple[List[float], int]:
+    r = oa.embeddings.create(**embed_request(text))
     vec = r.data[0].embedding
     tokens = r.usage.prompt_tokens
     print_embed_cost(tokens)
     return vec, tokens
 
+def embed_text(text: str) -> Tuple[List[float], int]:
+    return embed_flight.do((EMBED_MODEL, DIMENSION, normalize_text(text)), lambda: _embed_text(text))
+
+def _embed_batch(texts: List[str]) -> Tuple[List[List[float]], int]:
+    r = oa.embeddings.create(**embed_request(texts))
+    vecs = [d.embedding for d in sorted(r.data, key=lambda d: d.index)]
+    return vecs, r.usage.prompt_tokens
+
+def embed_texts(texts: List[str]) -> Tuple[List[List[float]], int]:
+    """Embed several texts in one request. Returns vectors in input order and total tokens."""
+    vecs, tokens = _embed_batch(texts)
+    print_embed_cost(tokens)
+    return vecs, tokens
+
+query_batcher = EmbeddingBatcher(_embed_batch, window_ms=EMBED_BATCH_WINDOW_MS, max_batch=EMBED_BATCH_MAX)
+
+def _embed_query(text: str) -> Tuple[List[float], int]:
+    vec, tokens = query_batcher.embed(text)
+    # Reported here rather than in the batcher thread so the caller's cost_sink sees its share
+    print_embed_cost(tokens)
+    return vec, tokens
+
+def embed_query(text: str) -> Tuple[List[float], int]:
+    """Embed a search query, sharing upstream requests with concurrent sessions."""
+    if EMBED_BATCH_WINDOW_MS <= 0:
+        return embed_text(text)
+    return embed_flight.do((EMBED_MODEL, DIMENSION, normalize_text(text)), lambda: _embed_query(text))
+
 # ---------- Chunking by Topic ----------
 def chunk_by_topic(text: str) -> List[Dict[str, str]]:
     text = re.sub(r'\r\n|\r', '\n', text)
@@ -165,19 +349,20 @@ def extract_text_from_file(filepath: str) -> str:
         if ext == '.pdf' and PyPDF2:
             with open(filepath, 'rb') as f:
                 reader = PyPDF2.PdfReader(f)
-                return '\n\n'.join([page.extract_text() or '' for page in reader.pages])
+                pages = []
+                for page in reader.pages:
+                    pages.append(page.extract_text() or '')
+                    report_progress(pages=1)
+                return '\n\n'.join(pages)
         elif ext == '.txt':
             with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()
+                text = f.read()
+            report_progress(pages=1)
+            return text
         elif ext == '.docx' and docx2txt:
-            return docx2txt.process(filepath)
-        elif ext == '.csv':
-            import csv
-            rows = []
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                for row in csv.reader(f):
-                    rows.append(', '.join(row))
-            return '\n'.join(rows)
+            text = docx2txt.process(filepath)
+            report_progress(pages=1)
+            return text
         else:
             raise ValueError(f"Unsupported file: {ext}")
     except Exception as e:
@@ -190,64 +375,294 @@ def scrape_url(url: str) -> str:
         return ""
     try:
         resp = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'}, timeout=10)
-        soup = BeautifulSoup(resp.content, 'lxml')
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text(separator='\n')
-        return re.sub(r'\n\s*\n+', '\n\n', text).strip()
+        report_progress(pages=1)
+        return html_to_text(resp.content)
     except Exception as e:
         print(f"⚠️ Scraping failed: {e}")
         return ""
 
+# ---------- Ingest Helpers ----------
+def url_source(url: str) -> str:
+    """Source tag for vectors ingested from a web page or site (one tag per host)."""
+    return f"url_{urlparse(url).netloc}"
+
+@profiled("ingest_file")
+def ingest_file(filepath: str, source: str) -> int:
+    """Extract, chunk and upsert a local file. Returns the number of chunks upserted (0 if no new text)."""
+    if is_tabular(filepath):
+        return ingest_table(filepath, source)
+    text = extract_text_from_file(filepath)
+    if not text.strip():
+        return 0
+    return upsert_chunks(chunk_by_topic(text), source=source)
+
+def ingest_table(filepath: str, source: str) -> int:
+    """Stream a CSV/TSV file into the index in constant memory. Returns the number of chunks upserted."""
+    created_at = int(time.time())   # every batch belongs to the same ingest of this file
+    seen, upserted, batch = 0, 0, []
+    for chunk in iter_table_chunks(filepath):
+        batch.append(chunk)
+        if len(batch) >= TABLE_UPSERT_CHUNKS:
+            upserted += upsert_chunks(batch, source=source, id_offset=seen, created_at=created_at)
+            seen += len(batch)
+            batch = []
+    if batch:
+        upserted += upsert_chunks(batch, source=source, id_offset=seen, created_at=created_at)
+    return upserted
+
+@profiled("ingest_url")
+def ingest_url(url: str) -> int:
+    """Scrape, chunk and upsert a single web page. Returns the number of chunks upserted (0 if no new text)."""
+    text = scrape_url(url)
+    if not text.strip():
+        return 0
+    return upsert_chunks(chunk_by_topic(text), source=url_source(url), doc=url)
+
+@profiled("crawl_site")
+def crawl_site(url: str, max_depth: int = CRAWL_MAX_DEPTH, max_pages: int = CRAWL_MAX_PAGES) -> int:
+    """Crawl same-site pages from `url`, upserting each page as it arrives. Returns chunks upserted.
+
+    Pages the server reports unchanged (304) are skipped unless their vectors have
+    since expired.
+    """
+    crawler = SiteCrawler(url, max_depth=max_depth, max_pages=max_pages, workers=CRAWL_WORKERS,
+                          cache_dir=CRAWL_CACHE_DIR)
+    source = url_source(url)
+    ttl_sec = DEFAULT_TTL_HOURS * 3600
+    seen, upserted = 0, 0
+
+    def on_page(page: CrawledPage) -> bool:
+        nonlocal seen, upserted
+        report_progress(pages=1)
+        expired = ttl_sec > 0 and time.time() - page.fetched_at > ttl_sec
+        if not (page.changed or expired) or not page.text.strip():
+            return False
+        chunks = chunk_by_topic(page.text)
+        seen += len(chunks)
+        upserted += upsert_chunks(chunks, source=source, id_offset=seen - len(chunks), doc=page.url)
+        print(f"🌐 Crawled (depth {page.depth}): {page.url} → {len(chunks)} chunks")
+        return True
+
+    stats = crawler.crawl(on_page)
+    print(f"✅ Crawl done: {stats.fetched} fetched, {stats.not_modified} unchanged, "
+          f"{stats.blocked_by_robots} blocked by robots.txt, {stats.errors} errors")
+    return upserted
+
 # ---------- Upsert with TTL ----------
-def upsert_chunks(chunks: List[Dict[str, str]], source: str = "unknown", ttl_hours: int = DEFAULT_TTL_HOURS):
+def upsert_chunks(chunks: List[Dict[str, str]], source: str = "unknown", ttl_hours: int = DEFAULT_TTL_HOURS,
+                  id_offset: int = 0, doc: Optional[str] = None, created_at: Optional[int] = None) -> int:
+    """Embed and upsert chunks in batches. `id_offset` keeps IDs unique across incremental calls.
+
+    `doc` names the document within the source (the source itself by default,
+    the page URL for web pages). Calls sharing a `created_at` form one ingest of
+    that document, which replaces its earlier ingests in study material.
+
+    Returns the number of chunks upserted.
+    """
     expiry = None
     if ttl_hours > 0:
         expiry = int((datetime.utcnow() + timedelta(hours=ttl_hours)).timestamp())
+    created_at = int(time.time()) if created_at is None else created_at
+    doc = doc or source
     
-    for i, chunk in enumerate(chunks):
-        content = chunk['content'][:10000]
+    dedup = get_dedup_index() if DEDUP_MODE != "off" else None
+    pending = []
+    duplicate_of: Dict[str, str] = {}
+    for i, chunk in enumerate(chunks, start=id_offset):
         title = chunk['title'][:200]
-        if not content.strip():
-            continue
-        
-        vec, _ = embed_text(content)
-        doc_id = f"{source}_{int(time.time())}_{i}"
-        metadata = {
-            "title": title,
-            "text": content,
-            "source": source,
-            "created_at": int(time.time())
-        }
-        if expiry:
-            metadata["expires_at"] = expiry
-        
-        # Upsert with version compatibility
-        if PINECONE_NEW:
-            index.upsert(
-                vectors=[{"id": doc_id, "values": vec, "metadata": metadata}],
-                namespace=NAMESPACE
-            )
-        else:
-            index.upsert(
-                vectors=[(doc_id, vec, metadata)],
-                namespace=NAMESPACE
-            )
-        
-        print(f"✅ Upserted: {title[:50]}...")
+        section_id = f"{source}_{created_at}_s{i}"
+        # Each topic section becomes one or more retrieval chunks sharing a section_id
+        for j, part in enumerate(split_section(chunk['content'], SECTION_CHUNK_CHARS)):
+            content = part[:MAX_CHUNK_CHARS]
+            doc_id = f"{source}_{created_at}_{i}" + (f"_{j}" if j else "")
+            if dedup:
+                dup_id, similarity, signature = dedup.check(content)
+                if dup_id:
+                    record_duplicate(dedup, dup_id, source, title, similarity)
+                    duplicate_of[doc_id] = dup_id
+                else:
+                    # Registered before embedding so duplicates later in this same upload are caught too
+                    dedup.add(doc_id, source, signature, expires_at=expiry)
+            pending.append((doc_id, title, content, section_id))
+    if duplicate_of:
+        # The duplicates' content must live as long as this ingest does, not just as long as the first one
+        extend_expiry(dedup, list(dict.fromkeys(duplicate_of.values())), expiry)
+    
+    upserted = 0
+    sections = SectionCentroids()
+    for start in range(0, len(pending), UPSERT_BATCH):
+        batch = pending[start:start + UPSERT_BATCH]
+        new = [entry for entry in batch if entry[0] not in duplicate_of]
+        try:
+            vecs = _upsert_batch(batch, duplicate_of, source, doc, created_at, expiry)
+        except Exception:
+            if dedup:
+                dedup.remove([doc_id for doc_id, _, _, _ in pending[start:] if doc_id not in duplicate_of])
+            raise
+        for (_, title, _, section_id), vec in zip(new, vecs):
+            sections.add(section_id, vec, _vector_metadata(title, source, created_at, expiry))
+        # Written per batch so a later failure leaves every upserted chunk reachable through its section;
+        # a section spanning batches is overwritten with its updated centroid
+        _upsert_sections(sections, dict.fromkeys(section_id for _, _, _, section_id in new))
+        upserted += len(new)
+        report_progress(chunks=len(new))
+        if new:
+            print(f"✅ Upserted {len(new)} chunks: {new[0][1][:50]}...")
+    return upserted
+
+def _vector_metadata(title: str, source: str, created_at: int, expiry: Optional[int], **extra) -> Dict:
+    metadata = {
+        "title": title,
+        "source": source,
+        "created_at": created_at,
+        **extra
+    }
+    if expiry:
+        metadata["expires_at"] = expiry
+    return metadata
+
+def _pinecone_upsert(vectors: List[Tuple[str, List[float], Dict]], namespace: str):
+    # Upsert with version compatibility
+    if PINECONE_NEW:
+        index.upsert(
+            vectors=[{"id": doc_id, "values": vec, "metadata": metadata} for doc_id, vec, metadata in vectors],
+            namespace=namespace
+        )
+    else:
+        index.upsert(
+            vectors=vectors,
+            namespace=namespace
+        )
+
+def _upsert_batch(batch: List[Tuple[str, str, str, str]], duplicate_of: Dict[str, str], source: str, doc: str,
+                  created_at: int, expiry: Optional[int]) -> List[List[float]]:
+    """Embed and upsert the batch's new chunks and return their vectors, in order.
+
+    Every chunk gets a docstore row; a near-duplicate's row points at its
+    canonical chunk instead of repeating the text.
+    """
+    new = [entry for entry in batch if entry[0] not in duplicate_of]
+    vecs = embed_texts([content for _, _, content, _ in new])[0] if new else []
+    # Full text lives in the docstore; the vector only carries slim, filterable fields
+    get_docstore().put_many([
+        {"id": doc_id, "source": source, "doc": doc, "title": title, "created_at": created_at, "expires_at": expiry,
+         "text": "" if doc_id in duplicate_of else content, "canonical_id": duplicate_of.get(doc_id)}
+        for doc_id, title, content, _ in batch
+    ])
+    router.vocab.request_sync()
+    if new:
+        _pinecone_upsert([
+            (doc_id, vec, _vector_metadata(title, source, created_at, expiry, section_id=section_id))
+            for (doc_id, title, _, section_id), vec in zip(new, vecs)
+        ], NAMESPACE)
+    return vecs
+
+def _upsert_sections(sections: SectionCentroids, section_ids: Optional[Iterable[str]] = None):
+    """Write one summary vector per section: the normalized mean of its chunk vectors (no extra embedding calls)."""
+    vectors = list(sections.items(section_ids))
+    for start in range(0, len(vectors), UPSERT_BATCH):
+        _pinecone_upsert(vectors[start:start + UPSERT_BATCH], SECTION_NAMESPACE)
+
+def extend_expiry(dedup: DedupIndex, canonical_ids: List[str], expiry: Optional[int]):
+    """Keep canonical chunks (and their sections) alive until at least `expiry`, everywhere they are stored."""
+    expiring = dedup.expiring_before(canonical_ids, expiry)
+    if not expiring:
+        return
+    # Without a TTL queries do not filter on expires_at, so only the local stores need updating
+    if expiry is not None:
+        try:
+            section_ids = set()
+            for start in range(0, len(expiring), UPSERT_BATCH):
+                res = index.fetch(ids=expiring[start:start + UPSERT_BATCH], namespace=NAMESPACE)
+                fetched = res["vectors"] if isinstance(res, dict) else res.vectors
+                for vec in fetched.values():
+                    metadata = (vec.get("metadata") if isinstance(vec, dict) else vec.metadata) or {}
+                    if metadata.get("section_id"):
+                        section_ids.add(metadata["section_id"])
+            for vec_id in expiring:
+                index.update(id=vec_id, set_metadata={"expires_at": expiry}, namespace=NAMESPACE)
+            for section_id in section_ids:
+                index.update(id=section_id, set_metadata={"expires_at": expiry}, namespace=SECTION_NAMESPACE)
+        except Exception as e:
+            # Local expiry is left as is, so the next duplicate of these chunks tries again
+            print(f"⚠️ TTL extension failed for {len(expiring)} chunks: {e}")
+            return
+        print(f"♻️ Extended the TTL of {len(expiring)} existing chunks and {len(section_ids)} sections")
+    dedup.set_expiry(expiring, expiry)
+    get_docstore().extend_expiry(expiring, expiry)
+
+def record_duplicate(dedup: DedupIndex, canonical_id: str, source: str, title: str, similarity: float):
+    dedup.add_alias(canonical_id, source, title, similarity)
+    print(f"♻️ Skipped near-duplicate of {canonical_id} (similarity {similarity:.2f}): {title[:50]}...")
+    if DEDUP_MODE != "merge":
+        return
+    alias_sources = sorted({a["source"] for a in dedup.aliases(canonical_id)})
+    try:
+        index.update(id=canonical_id, set_metadata={"alias_sources": alias_sources}, namespace=NAMESPACE)
+    except Exception as e:
+        print(f"⚠️ Alias merge failed for {canonical_id}: {e}")
 
 # ---------- Retrieval (with TTL filter) ----------
-def retrieve(query: str, top_k: int = TOP_K) -> List[Dict]:
-    qvec, _ = embed_text(query)
+section_cache = SectionCache()
+
+def retrieve(query: str, top_k: int = TOP_K, session_id: Optional[str] = None) -> List[Dict]:
+    # The session is part of the key: hierarchical retrieval reads and fills that session's section cache
+    key = (normalize_text(query), top_k, session_id if RETRIEVAL_MODE == "hierarchical" else None)
+    return retrieve_flight.do(key, lambda: _retrieve(query, top_k, session_id))
+
+def _retrieve(query: str, top_k: int, session_id: Optional[str] = None) -> List[Dict]:
+    qvec, _ = embed_query(query)
     current_ts = int(time.time())
     
+    if RETRIEVAL_BACKEND == "local":
+        return get_local_index().search(qvec, top_k, now=current_ts if DEFAULT_TTL_HOURS > 0 else float("-inf"))
+    if RETRIEVAL_MODE == "hierarchical" and not _has_legacy_chunks(qvec, current_ts):
+        sections = _top_sections(qvec, session_id, current_ts)
+        # Search inside the chosen sections only when they hold enough chunks to fill top_k
+        if sum(n for _, n in sections) >= top_k:
+            return _query_namespace(qvec, top_k, NAMESPACE, current_ts,
+                                    {"section_id": {"$in": [section_id for section_id, _ in sections]}})
+    return _query_namespace(qvec, top_k, NAMESPACE, current_ts)
+
+def _top_sections(qvec: List[float], session_id: Optional[str], current_ts: int) -> List[Tuple[str, int]]:
+    """Coarse pass: the best-matching (section_id, n_chunks), reused across similar questions in one session."""
+    sections = section_cache.lookup(session_id, qvec)
+    if sections is None:
+        sections = [(m.get("id"), int(m.get("metadata", {}).get("n_chunks", 0)))
+                    for m in _query_namespace(qvec, SECTION_TOP_K, SECTION_NAMESPACE, current_ts)]
+        if sections:
+            section_cache.store(session_id, qvec, sections)
+    return sections
+
+_legacy_checked_at = 0.0
+_legacy_chunks = True
+
+def _has_legacy_chunks(qvec: List[float], current_ts: int) -> bool:
+    """Whether the index still holds chunks without a section (ingested before sections existed,
+    or restored from an older snapshot). Those are invisible to a section-filtered search, so
+    hierarchical retrieval searches flat until they are gone. Re-checked every LEGACY_CHECK_SEC."""
+    global _legacy_checked_at, _legacy_chunks
+    if time.time() - _legacy_checked_at >= LEGACY_CHECK_SEC:
+        try:
+            _legacy_chunks = bool(_query_namespace(qvec, 1, NAMESPACE, current_ts, {"section_id": {"$exists": False}}))
+            _legacy_checked_at = time.time()
+        except Exception as e:
+            print(f"⚠️ Legacy chunk check failed, searching flat: {e}")
+            return True
+    return _legacy_chunks
+
+def _query_namespace(qvec: List[float], top_k: int, namespace: str, current_ts: int,
+                     metadata_filter: Optional[Dict] = None) -> List[Dict]:
     if PINECONE_NEW:
+        clauses = [metadata_filter] if metadata_filter else []
+        if DEFAULT_TTL_HOURS > 0:
+            clauses.append({"expires_at": {"$gt": current_ts}})
         res = index.query(
             vector=qvec,
             top_k=top_k,
             include_metadata=True,
-            namespace=NAMESPACE,
-            filter={"expires_at": {"$gt": current_ts}} if DEFAULT_TTL_HOURS > 0 else None
+            namespace=namespace,
+            filter=({"$and": clauses} if len(clauses) > 1 else clauses[0]) if clauses else None
         )
         matches = res.get("matches", [])
     else:
@@ -256,20 +671,32 @@ def retrieve(query: str, top_k: int = TOP_K) -> List[Dict]:
             vector=qvec,
             top_k=top_k,
             include_metadata=True,
-            namespace=NAMESPACE
+            namespace=namespace,
+            filter=metadata_filter
         )
         matches = res.get("matches", [])
         # Manual TTL filtering for old version
         if DEFAULT_TTL_HOURS > 0:
             matches = [m for m in matches if m.get("metadata", {}).get("expires_at", float('inf')) > current_ts]
     
-    return [m for m in matches if (m.get("metadata") or {}).get("text")]
-
-def build_context(matches: List[Dict]) -> str:
+    return list(matches)
+
+def match_texts(matches: List[Dict]) -> Dict[str, str]:
+    """Chunk text per match ID; matches with no text anywhere are absent."""
+    texts = get_docstore().get_many([m.get("id") for m in matches])
+    for m in matches:
+        # Vectors upserted before the docstore existed still carry their text in metadata
+        legacy = (m.get("metadata") or {}).get("text")
+        if legacy and m.get("id") not in texts:
+            texts[m.get("id")] = legacy
+    return texts
+
+def build_context(matches: List[Dict], texts: Optional[Dict[str, str]] = None) -> str:
     matches = sorted(matches, key=lambda m: m.get("score", 0), reverse=True)
+    texts = match_texts(matches) if texts is None else texts
     parts, size = [], 0
     for i, m in enumerate(matches, 1):
-        t = (m.get("metadata") or {}).get("text", "")
+        t = texts.get(m.get("id"))
         if not t:
             continue
         chunk = f"[{i} | score={m.get('score', 0):.3f}]\n{t}\n"
@@ -280,39 +707,98 @@ def build_context(matches: List[Dict]) -> str:
     return "\n".join(parts)
 
 # ---------- LLM Answer ----------
-def ask_llm(question: str, context: str = "", style: str = "concise", lang: str = "en") -> Tuple[str, int, int]:
+def chat_request(question: str, context: str = "", style: str = "concise", lang: str = "en",
+                 model: str = CHAT_MODEL) -> Dict:
     lang_instr = "Answer in Hindi using Devanagari script." if lang == "hi" else "Answer in English."
     style_instr = "Provide detailed explanation with examples." if style == "detailed" else "Keep answer concise."
     sys_prompt = f"You are Ycotes, an AI tutor. {lang_instr} {style_instr} Use context if provided."
     user_prompt = f"Question:\n{question}\n\nContext:\n{context}" if context else f"Question:\n{question}"
-    
-    r = oa.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[{"role": "system", "content": sys_prompt}, {"role": "user", "content": user_prompt}],
-        temperature=0.4 if style == "concise" else 0.7,
-        max_tokens=300 if style == "concise" else 800
-    )
+    return {
+        "model": model,
+        "messages": [{"role": "system", "content": sys_prompt}, {"role": "user", "content": user_prompt}],
+        "temperature": 0.4 if style == "concise" else 0.7,
+        "max_tokens": 300 if style == "concise" else 800
+    }
+
+def ask_llm(question: str, context: str = "", style: str = "concise", lang: str = "en",
+            model: str = CHAT_MODEL) -> Tuple[str, int, int]:
+    key = (model, normalize_text(question), context, style, lang)
+    return llm_flight.do(key, lambda: _ask_llm(question, context, style, lang, model))
+
+def _ask_llm(question: str, context: str, style: str, lang: str, model: str) -> Tuple[str, int, int]:
+    started = time.perf_counter()
+    r = oa.chat.completions.create(**chat_request(question, context, style, lang, model))
+    router.record_latency(f"llm:{model}", time.perf_counter() - started)
     ans = r.choices[0].message.content.strip()
     usage = r.usage
     in_t, out_t = usage.prompt_tokens, usage.completion_tokens
-    print_chat_cost(in_t, out_t)
+    print_chat_cost(in_t, out_t, model)
     return ans, in_t, out_t
 
-def answer(question: str, style: str = "concise", lang: str = "en") -> str:
+def ask_llm_stream(question: str, context: str = "", style: str = "concise", lang: str = "en",
+                   model: str = CHAT_MODEL) -> Iterator[str]:
+    """Same as ask_llm but yields answer text as it is generated."""
+    stream = oa.chat.completions.create(
+        **chat_request(question, context, style, lang, model),
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            yield event.choices[0].delta.content
+        if getattr(event, "usage", None):
+            print_chat_cost(event.usage.prompt_tokens, event.usage.completion_tokens, model)
+
+def answer_context(question: str, session_id: Optional[str] = None) -> str:
+    """Retrieve and assemble context for a question; empty when nothing matches strongly."""
     print(f"\n🔍 Retrieving from Pinecone for: {question}")
-    matches = retrieve(question)
-    strong = [m for m in matches if m.get("score", 0) >= MIN_SCORE]
+    started = time.perf_counter()
+    matches = retrieve(question, session_id=session_id)
+    router.record_latency("retrieve", time.perf_counter() - started)
+    texts = match_texts(matches)
+    # A match whose text is in no docstore on this host (e.g. ingested elsewhere) cannot help the answer
+    strong = [m for m in matches if m.get("score", 0) >= MIN_SCORE and texts.get(m.get("id"))]
     
     if not strong:
         print(" No strong matches — asking LLM directly.")
-        ans, _, _ = ask_llm(question, style=style, lang=lang)
-        return ans
+        return ""
         
     print(f"✅ {len(strong)} relevant chunks found.")
-    ctx = build_context(strong)
-    ans, _, _ = ask_llm(question, context=ctx, style=style, lang=lang)
+    return build_context(strong, texts)
+
+def route_query(question: str, style: str = "concise") -> RouteDecision:
+    if not ROUTER_ENABLED:
+        return RouteDecision(True, CHAT_MODEL, 1.0, "router disabled", 1.0)
+    return router.route(question, style)
+
+@profiled("answer")
+def answer(question: str, style: str = "concise", lang: str = "en", session_id: Optional[str] = None) -> str:
+    started = time.perf_counter()
+    decision = route_query(question, style)
+    ctx = answer_context(question, session_id) if decision.retrieve else ""
+    ans, _, _ = ask_llm(question, context=ctx, style=style, lang=lang, model=decision.model)
+    
+    escalated = False
+    if decision.model != CHAT_MODEL and router.looks_unsure(ans):
+        # Low-confidence answer from the fast model: retry with retrieval and the strong model
+        escalated = True
+        if not decision.retrieve:
+            ctx = answer_context(question, session_id)
+        ans, _, _ = ask_llm(question, context=ctx, style=style, lang=lang, model=CHAT_MODEL)
+    if ROUTER_ENABLED:
+        router.log(question, decision, escalated, time.perf_counter() - started)
     return ans
 
+def answer_stream(question: str, style: str = "concise", lang: str = "en",
+                  session_id: Optional[str] = None) -> Iterator[str]:
+    # Streamed text cannot be taken back, so only the up-front routing decision applies
+    started = time.perf_counter()
+    decision = route_query(question, style)
+    ctx = answer_context(question, session_id) if decision.retrieve else ""
+    yield from ask_llm_stream(question, context=ctx, style=style, lang=lang, model=decision.model)
+    if ROUTER_ENABLED:
+        router.log(question, decision, False, time.perf_counter() - started)
+
 # ---------- Socratic Explainer ----------
 def generate_sub_questions(main_question: str, lang: str = "en") -> List[str]:
     lang_prompt = "Generate questions in Hindi." if lang == "hi" else "Generate questions in English."
@@ -339,6 +825,7 @@ Why are data structures important?
             max_tokens=150
         )
         raw = r.choices[0].message.content.strip()
+        print_chat_cost(r.usage.prompt_tokens, r.usage.completion_tokens)
         
         cleaned_questions = []
         for line in raw.split('\n'):
@@ -361,5 +848,44 @@ Why are data structures important?
         print(f"⚠️ Sub-question gen failed: {e}")
         return [f"What is {main_question}?"]
 
+# ---------- Study Material (notes / summary / quiz) ----------
+_study_generator = None
+_study_lock = threading.Lock()
+
+def _complete(system: str, user: str, model: str, max_tokens: int) -> Tuple[str, int, int]:
+    r = oa.chat.completions.create(
+        model=model,
+        messages=[{"role": "system", "content": system}, {"role": "user", "content": user}],
+        temperature=0.3,
+        max_tokens=max_tokens
+    )
+    in_t, out_t = r.usage.prompt_tokens, r.usage.completion_tokens
+    print_chat_cost(in_t, out_t, model)
+    if r.choices[0].finish_reason == "length":
+        raise OutputTruncated(f"{model} stopped at max_tokens={max_tokens}")
+    return r.choices[0].message.content or "", in_t, out_t
+
+def get_study_generator() -> StudyGenerator:
+    global _study_generator
+    with _study_lock:
+        if _study_generator is None:
+            _study_generator = StudyGenerator(
+                _complete, map_model=FAST_CHAT_MODEL, reduce_model=CHAT_MODEL, workers=STUDY_GEN_WORKERS,
+                limiter=RateLimiter(STUDY_GEN_RPM, STUDY_GEN_TPM), store=StudyStore()
+            )
+        return _study_generator
+
+def generate_study_material(source: str, kind: str = "notes", lang: str = "en", force: bool = False,
+                            on_progress: Optional[Callable[[int, int], None]] = None
+                            ) -> Tuple[str, GenerationStats]:
+    """Notes, summary or quiz for an ingested source; unchanged documents return the stored artifact."""
+    chunks = [(c["title"], c["text"]) for c in get_docstore().iter_source(source)]
+    content, stats = get_study_generator().generate(source, chunks, kind, lang, force=force,
+                                                    on_progress=on_progress)
+    print(f"📝 Study {kind} for {source}: {stats.chunks} chunks, {stats.map_calls} map / "
+          f"{stats.reduce_calls} reduce calls, {stats.map_cached + stats.reduce_cached} cached, "
+          f"{stats.elapsed_sec:.1f}s")
+    return content, stats
+
 # Export for Streamlit app
 VOICE_AVAILABLE = False
\ No newline at end of file
@@ -0,0 +1,109 @@
+# benchmarks/bench_hierarchical.py
+#
+# Latency and recall@TOP_K of two-level (section -> chunk) retrieval vs flat search.
+#
+#   python benchmarks/bench_hierarchical.py                       # synthetic textbook-like corpus
+#   python benchmarks/bench_hierarchical.py --sections 2000 --chunks-per-section 12
+#
+# Ground truth is exact cosine search over every chunk. The hierarchical pass ranks
+# section centroids (as built by hierarchy.SectionCentroids at ingest), then scores only
+# the chunks of the top `section_k` sections, which is what the `section_id $in` filter
+# asks the vector index to do. Queries arrive in sessions of follow-up questions so the
+# per-session coarse cache (hierarchy.SectionCache) hit rate is reported too.
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hierarchy import SectionCache  # noqa: E402
+from local_index import normalize_rows  # noqa: E402
+
+TOP_K = 6  # mirrors backend_rag.TOP_K (importing backend_rag needs API keys)
+
+
+def synthetic_sections(n_sections: int, per_section: int, dim: int, seed: int = 0):
+    """Chunks clustered around their section's topic, sections loosely grouped into chapters."""
+    rng = np.random.default_rng(seed)
+    chapters = rng.standard_normal((max(1, n_sections // 20), dim)).astype(np.float32)
+    topics = chapters[rng.integers(0, len(chapters), n_sections)] + \
+        rng.standard_normal((n_sections, dim)).astype(np.float32) * 0.5
+    sizes = rng.integers(max(1, per_section // 2), per_section * 3 // 2 + 1, n_sections)
+    section_of = np.repeat(np.arange(n_sections), sizes)
+    chunks = topics[section_of] + rng.standard_normal((len(section_of), dim)).astype(np.float32) * 1.5
+    chunks = normalize_rows(chunks)
+
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    centroids = normalize_rows(np.stack([chunks[offsets[s]:offsets[s + 1]].mean(axis=0)
+                                         for s in range(n_sections)]))
+    return chunks, centroids, offsets
+
+
+def session_queries(chunks: "np.ndarray", n_sessions: int, followups: int, seed: int = 1):
+    """Each session picks a chunk and asks `followups` rephrasings near it."""
+    rng = np.random.default_rng(seed)
+    sessions = []
+    for s in range(n_sessions):
+        anchor = chunks[rng.integers(0, len(chunks))]
+        qs = anchor + rng.standard_normal((followups, chunks.shape[1])).astype(np.float32) * 0.008
+        sessions.append((f"session-{s}", normalize_rows(qs)))
+    return sessions
+
+
+def top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    k = min(k, len(scores))
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hierarchical vs flat retrieval benchmark")
+    parser.add_argument("--sections", type=int, default=4000)
+    parser.add_argument("--chunks-per-section", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--followups", type=int, default=4, help="Questions per session")
+    parser.add_argument("--section-ks", default="1,2,3,5,10")
+    args = parser.parse_args()
+
+    chunks, centroids, offsets = synthetic_sections(args.sections, args.chunks_per_section, args.dim)
+    sessions = session_queries(chunks, args.sessions, args.followups)
+    queries = np.concatenate([qs for _, qs in sessions])
+
+    started = time.perf_counter()
+    truth = [set(top_k(chunks @ q, TOP_K).tolist()) for q in queries]
+    flat_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    print(f"chunks={len(chunks)}  sections={len(centroids)}  dim={args.dim}  "
+          f"queries={len(queries)} ({args.sessions} sessions x {args.followups})  top_k={TOP_K}")
+    print(f"{'mode':>14} {'rows scored':>12} {'recall@k':>9} {'ms/query':>9} {'speedup':>8} {'cache hits':>11}")
+    print(f"{'flat':>14} {len(chunks):>12,} {1.0:>9.3f} {flat_ms:>9.2f} {1.0:>7.1f}x {'-':>11}")
+
+    for section_k in [int(k) for k in args.section_ks.split(",")]:
+        cache = SectionCache()
+        qi, hits, scored = 0, 0, 0
+        started = time.perf_counter()
+        for session_id, qs in sessions:
+            for q in qs:
+                qvec = q.tolist()
+                picked = cache.lookup(session_id, qvec)
+                if picked is None:
+                    picked = top_k(centroids @ q, section_k).tolist()
+                    cache.store(session_id, qvec, picked)
+                    scored += len(centroids)
+                rows = np.concatenate([np.arange(offsets[s], offsets[s + 1]) for s in picked])
+                found = rows[top_k(chunks[rows] @ q, TOP_K)]
+                scored += len(rows)
+                hits += len(set(found.tolist()) & truth[qi])
+                qi += 1
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = hits / (TOP_K * len(queries))
+        cache_hits = cache.stats()["hits"]
+        print(f"{f'sections={section_k}':>14} {scored // len(queries):>12,} {recall:>9.3f} {elapsed_ms:>9.2f} "
+              f"{flat_ms / elapsed_ms:>7.1f}x {cache_hits:>5}/{len(queries):<5}")
+
+
+if __name__ == "__main__":
+    main()
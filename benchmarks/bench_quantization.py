@@ -0,0 +1,85 @@
+# benchmarks/bench_quantization.py
+#
+# Memory saved vs recall@TOP_K lost for shortened + quantized embeddings.
+#
+#   python benchmarks/bench_quantization.py                  # synthetic corpus
+#   python benchmarks/bench_quantization.py --vectors v.npy  # real (n, 1536) embeddings
+#
+# Ground truth is exact cosine search over the full 1536-d float32 vectors; every
+# other configuration truncates to `dim` (renormalized, as the `dimensions` API
+# parameter does), searches its quantized codes and rescores with float32.
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local_index import QuantizedIndex, normalize_rows  # noqa: E402
+
+TOP_K = 6  # mirrors backend_rag.TOP_K (importing backend_rag needs API keys)
+
+
+def synthetic_corpus(n: int, dim: int, seed: int = 0) -> "np.ndarray":
+    """Clustered vectors whose variance decays across dimensions, like Matryoshka embeddings."""
+    rng = np.random.default_rng(seed)
+    decay = np.exp(-np.arange(dim) / (dim / 4)).astype(np.float32)
+    centers = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32) * decay
+    assign = rng.integers(0, len(centers), n)
+    noise = rng.standard_normal((n, dim)).astype(np.float32) * decay * 0.5
+    return normalize_rows(centers[assign] + noise)
+
+
+def make_queries(corpus: "np.ndarray", n_queries: int, seed: int = 1) -> "np.ndarray":
+    rng = np.random.default_rng(seed)
+    picks = corpus[rng.integers(0, len(corpus), n_queries)]
+    return normalize_rows(picks + rng.standard_normal(picks.shape).astype(np.float32) * 0.02)
+
+
+def exact_top_k(corpus: "np.ndarray", queries: "np.ndarray", k: int) -> "np.ndarray":
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized index memory vs recall benchmark")
+    parser.add_argument("--vectors", help="Path to an (n, d) float32 .npy matrix of real embeddings")
+    parser.add_argument("--n", type=int, default=50_000, help="Synthetic corpus size")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dims", default="1536,768,512,256")
+    parser.add_argument("--oversample", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.vectors:
+        corpus = normalize_rows(np.load(args.vectors, mmap_mode="r"))
+    else:
+        corpus = synthetic_corpus(args.n, 1536)
+    queries = make_queries(corpus, args.queries)
+    truth = exact_top_k(corpus, queries, TOP_K)
+    ids = [str(i) for i in range(len(corpus))]
+    baseline_bytes = corpus.shape[1] * 4
+
+    print(f"corpus={len(corpus)} x {corpus.shape[1]}  queries={len(queries)}  top_k={TOP_K}")
+    print(f"{'dim':>5} {'quant':>7} {'resident B/vec':>15} {'vs f32-1536':>12} {'chunks/GB':>12} "
+          f"{'recall@k':>9} {'ms/query':>9}")
+    for dim in [int(d) for d in args.dims.split(",")]:
+        reduced = normalize_rows(corpus[:, :dim])
+        q_reduced = normalize_rows(queries[:, :dim])
+        for quant in ("none", "int8", "binary"):
+            idx = QuantizedIndex(ids, reduced, quantization=quant, oversample=args.oversample, normalized=True)
+            mem = idx.memory_bytes()
+            # Quantized indexes keep only codes resident; full vectors can stay memory-mapped on disk
+            resident = (mem["coarse"] if quant != "none" else mem["full"]) / len(idx)
+            hits, started = 0, time.perf_counter()
+            for qi, q in enumerate(q_reduced):
+                found = {int(m["id"]) for m in idx.search(q, TOP_K)}
+                hits += len(found & set(truth[qi].tolist()))
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(q_reduced)
+            recall = hits / (TOP_K * len(q_reduced))
+            print(f"{dim:>5} {quant:>7} {resident:>15.0f} {baseline_bytes / resident:>11.1f}x "
+                  f"{(1 << 30) / resident:>12,.0f} {recall:>9.3f} {elapsed_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# chat_store.py
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Tuple, Any
+
+from storage import DATA_DIR, SQLiteStore, connect_sqlite
+
+# ---------- Config ----------
+CHAT_DB_PATH = os.getenv("YCOTES_CHAT_DB", os.path.join(DATA_DIR, "chat.db"))
+PAGE_SIZE = 20                # turns loaded into the UI per page
+FLUSH_INTERVAL_SEC = 0.25     # max time a write waits before being committed
+FLUSH_MAX_BATCH = 500         # max statements committed in one transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    uploaded_files TEXT NOT NULL DEFAULT '[]'
+);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    type TEXT,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_turns_session_ts ON turns(session_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_turns_session_id ON turns(session_id, id);
+CREATE TABLE IF NOT EXISTS costs (
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    tokens_in INTEGER NOT NULL,
+    tokens_out INTEGER NOT NULL,
+    usd REAL NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_costs_session ON costs(session_id);
+CREATE TABLE IF NOT EXISTS socratic (
+    session_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class ChatStore(SQLiteStore):
+    """Persists sessions, chat turns, costs and Socratic progress.
+
+    Reads go straight to SQLite (one connection per thread). Writes are queued
+    and committed in batches by a background thread, so the UI never waits on disk.
+    """
+
+    row_factory = sqlite3.Row
+
+    def __init__(self, path: str = CHAT_DB_PATH):
+        super().__init__(path, SCHEMA)
+        self._writes: "queue.Queue[Optional[Tuple[str, tuple]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="chat-store-writer", daemon=True)
+        self._writer.start()
+
+    # ---------- Batched writer ----------
+    def _enqueue(self, sql: str, params: tuple = ()):
+        self._writes.put((sql, params))
+
+    def _write_loop(self):
+        conn = connect_sqlite(self.path)
+        while True:
+            item = self._writes.get()
+            batch = [item]
+            deadline = time.monotonic() + FLUSH_INTERVAL_SEC
+            while len(batch) < FLUSH_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stop = None in batch
+            ops = [op for op in batch if op is not None]
+            try:
+                with conn:
+                    for op in ops:
+                        conn.execute(*op)
+            except Exception as e:
+                # The whole batch was rolled back: replay it one statement at a time so only the bad write is lost
+                print(f"⚠️ Chat store batch write failed ({e}); retrying {len(ops)} writes individually")
+                for op in ops:
+                    try:
+                        with conn:
+                            conn.execute(*op)
+                    except Exception as e:
+                        print(f"⚠️ Chat store write failed: {e} ({op[0][:60]})")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def flush(self):
+        """Block until every queued write has been committed."""
+        self._writes.join()
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join(timeout=5)
+
+    # ---------- Sessions ----------
+    def create_session(self) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self._enqueue(
+            "INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+            (session_id, now, now),
+        )
+        return session_id
+
+    def ensure_session(self, session_id: str):
+        now = time.time()
+        self._enqueue(
+            "INSERT OR IGNORE INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?)",
+            (session_id, now, now),
+        )
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT id, created_at, updated_at, uploaded_files FROM sessions WHERE id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "uploaded_files": json.loads(row["uploaded_files"] or "[]"),
+        }
+
+    def save_uploaded_files(self, session_id: str, files: List[str]):
+        self._enqueue(
+            "UPDATE sessions SET uploaded_files = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(files), time.time(), session_id),
+        )
+
+    # ---------- Turns ----------
+    def append_turn(self, session_id: str, turn: Dict[str, Any]):
+        ts = turn.get("timestamp") or time.time()
+        self._enqueue(
+            "INSERT INTO turns (session_id, role, content, type, timestamp) VALUES (?, ?, ?, ?, ?)",
+            (session_id, turn["role"], turn["content"], turn.get("type"), ts),
+        )
+        self._enqueue("UPDATE sessions SET updated_at = ? WHERE id = ?", (ts, session_id))
+
+    def load_turns(self, session_id: str, before_id: Optional[int] = None,
+                   limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return one page of turns (oldest first) stored before turn `before_id`, plus whether more exist.
+
+        Each turn carries its row `id`, the cursor for the next older page.
+        """
+        sql = "SELECT id, role, content, type, timestamp FROM turns WHERE session_id = ?"
+        params: list = [session_id]
+        if before_id is not None:
+            sql += " AND id < ?"
+            params.append(before_id)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        turns = []
+        for row in reversed(rows[:limit]):
+            turn = {"id": row["id"], "role": row["role"], "content": row["content"], "timestamp": row["timestamp"]}
+            if row["type"]:
+                turn["type"] = row["type"]
+            turns.append(turn)
+        return turns, has_more
+
+    def turn_id(self, session_id: str, timestamp: float) -> Optional[int]:
+        """Row ID of a turn appended in this process, once its write has been flushed."""
+        row = self._conn().execute(
+            "SELECT id FROM turns WHERE session_id = ? AND timestamp = ? ORDER BY id LIMIT 1", (session_id, timestamp)
+        ).fetchone()
+        return row["id"] if row else None
+
+    def clear_turns(self, session_id: str):
+        self._enqueue("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    # ---------- Costs ----------
+    def record_cost(self, session_id: str, kind: str, tokens_in: int, tokens_out: int, usd: float):
+        self._enqueue(
+            "INSERT INTO costs (session_id, kind, tokens_in, tokens_out, usd, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            (session_id, kind, tokens_in, tokens_out, usd, time.time()),
+        )
+
+    def session_cost(self, session_id: str) -> Dict[str, float]:
+        row = self._conn().execute(
+            "SELECT COALESCE(SUM(tokens_in), 0) AS tin, COALESCE(SUM(tokens_out), 0) AS tout, "
+            "COALESCE(SUM(usd), 0) AS usd FROM costs WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        return {"tokens_in": row["tin"], "tokens_out": row["tout"], "usd": row["usd"]}
+
+    # ---------- Socratic ----------
+    def save_socratic(self, session_id: str, state: Dict[str, Any]):
+        self._enqueue(
+            "INSERT OR REPLACE INTO socratic (session_id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state), time.time()),
+        )
+
+    def load_socratic(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT state FROM socratic WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return json.loads(row["state"]) if row else None
+
+
+_store: Optional[ChatStore] = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> ChatStore:
+    """Process-wide store shared by every session served by this worker."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChatStore()
+        return _store
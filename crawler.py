@@ -0,0 +1,265 @@
+# crawler.py - Same-site crawler with pooled connections and conditional-GET caching
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.robotparser import RobotFileParser
+
+try:
+    from bs4 import BeautifulSoup
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    BeautifulSoup = None
+    requests = None
+    HTTPAdapter = None
+
+USER_AGENT = "Mozilla/5.0 (compatible; YcotesBot/1.0)"
+SKIP_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico",
+    ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".woff", ".woff2", ".ttf",
+)
+
+
+def html_to_text(html: bytes) -> str:
+    soup = BeautifulSoup(html, 'lxml')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text(separator='\n')
+    return re.sub(r'\n\s*\n+', '\n\n', text).strip()
+
+
+def normalize_url(url: str) -> str:
+    """Drop the fragment and lowercase scheme/host so the frontier dedups equivalent URLs."""
+    url, _ = urldefrag(url)
+    parts = urlparse(url)
+    path = parts.path or "/"
+    normalized = f"{parts.scheme.lower()}://{parts.netloc.lower()}{path}"
+    return normalized + (f"?{parts.query}" if parts.query else "")
+
+
+# ---------- On-disk HTTP cache ----------
+class HttpCache:
+    """Response bodies plus ETag / Last-Modified validators, one pair of files per URL."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url: str) -> Tuple[str, str]:
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + ".json"), os.path.join(self.cache_dir, key + ".body")
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        meta_path, body_path = self._paths(url)
+        if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def validators(self, url: str) -> Dict[str, str]:
+        meta = self.lookup(url) or {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def load_body(self, url: str) -> bytes:
+        with open(self._paths(url)[1], "rb") as f:
+            return f.read()
+
+    def store(self, url: str, resp) -> Dict:
+        meta_path, body_path = self._paths(url)
+        meta = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "content_type": resp.headers.get("Content-Type", ""),
+            "fetched_at": time.time(),
+        }
+        with open(body_path, "wb") as f:
+            f.write(resp.content)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return meta
+
+    def touch(self, url: str):
+        """Restart the page's TTL after its unchanged body was ingested again."""
+        meta = self.lookup(url)
+        if meta is None:
+            return
+        meta["fetched_at"] = time.time()
+        with open(self._paths(url)[0], "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+
+# ---------- Crawler ----------
+@dataclass
+class CrawledPage:
+    url: str
+    depth: int
+    text: str
+    changed: bool          # False when the server answered 304 Not Modified
+    fetched_at: float      # when the cached body was last downloaded in full or re-ingested
+
+
+@dataclass
+class CrawlStats:
+    fetched: int = 0
+    not_modified: int = 0
+    blocked_by_robots: int = 0
+    skipped: int = 0
+    errors: int = 0
+    bytes_downloaded: int = 0
+    visited: List[str] = field(default_factory=list)
+
+
+class SiteCrawler:
+    """Breadth-first crawl of one site, bounded by depth, page count and worker count."""
+
+    def __init__(self, start_url: str, max_depth: int = 2, max_pages: int = 50, workers: int = 4,
+                 cache_dir: Optional[str] = None, timeout: float = 10, respect_robots: bool = True,
+                 user_agent: str = USER_AGENT):
+        if not BeautifulSoup or not requests:
+            raise ImportError("Install 'beautifulsoup4' and 'requests' to crawl sites")
+        self.start_url = normalize_url(start_url)
+        self.domain = urlparse(self.start_url).netloc
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.cache = HttpCache(cache_dir) if cache_dir else None
+        self.stats = CrawlStats()
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = user_agent
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=2)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._robots = self._load_robots() if respect_robots else None
+        self._stats_lock = threading.Lock()
+
+    def _load_robots(self) -> Optional[RobotFileParser]:
+        parts = urlparse(self.start_url)
+        robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+        parser = RobotFileParser(robots_url)
+        try:
+            resp = self.session.get(robots_url, timeout=self.timeout)
+        except Exception as e:
+            print(f"⚠️ robots.txt unavailable ({e}); crawling without it")
+            return None
+        if resp.status_code in (401, 403):
+            parser.disallow_all = True
+        elif resp.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(resp.text.splitlines())
+        return parser
+
+    def _allowed(self, url: str) -> bool:
+        return self._robots is None or self._robots.can_fetch(self.user_agent, url)
+
+    def _in_scope(self, url: str) -> bool:
+        parts = urlparse(url)
+        return (parts.scheme in ("http", "https") and parts.netloc.lower() == self.domain
+                and not parts.path.lower().endswith(SKIP_EXTENSIONS))
+
+    def _fetch(self, url: str, depth: int) -> Tuple[Optional[CrawledPage], List[str], Optional[object]]:
+        """Download one page. A 200 response is returned uncached; crawl() caches it once ingested.
+
+        Redirects are followed, so scope and robots.txt are checked again on the
+        final URL, and the page's links are resolved against it.
+        """
+        headers = self.cache.validators(url) if self.cache else {}
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        final_url = resp.url or url
+        if final_url != url and not (self._in_scope(final_url) and self._allowed(final_url)):
+            return None, [], None
+        if resp.status_code == 304 and self.cache:
+            fetched_at = self.cache.lookup(url)["fetched_at"]
+            body, changed = self.cache.load_body(url), False
+        elif resp.status_code == 200:
+            if "html" not in resp.headers.get("Content-Type", "html").lower():
+                return None, [], None
+            fetched_at = time.time()
+            body, changed = resp.content, True
+        else:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+
+        with self._stats_lock:
+            if changed:
+                self.stats.fetched += 1
+                self.stats.bytes_downloaded += len(body)
+            else:
+                self.stats.not_modified += 1
+
+        soup = BeautifulSoup(body, 'lxml')
+        links = [urljoin(final_url, a["href"]) for a in soup.find_all("a", href=True)] \
+            if depth < self.max_depth else []
+        page = CrawledPage(url=url, depth=depth, text=html_to_text(body), changed=changed, fetched_at=fetched_at)
+        return page, links, resp if changed else None
+
+    def crawl(self, on_page: Callable[[CrawledPage], bool]) -> CrawlStats:
+        """Crawl and hand each page to `on_page` as it arrives (called on this thread).
+
+        `on_page` returns True when it ingested the page. A page's body and
+        validators are cached only after `on_page` returns, so a page whose
+        ingest raised is downloaded in full again on the next crawl instead of
+        coming back as 304.
+        """
+        frontier = deque([(self.start_url, 0)])
+        seen: Set[str] = {self.start_url}
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="crawler") as pool:
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.workers and \
+                        len(self.stats.visited) + len(in_flight) < self.max_pages:
+                    url, depth = frontier.popleft()
+                    if not self._allowed(url):
+                        self.stats.blocked_by_robots += 1
+                        continue
+                    in_flight[pool.submit(self._fetch, url, depth)] = (url, depth)
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    url, depth = in_flight.pop(fut)
+                    try:
+                        page, links, resp = fut.result()
+                    except Exception as e:
+                        self.stats.errors += 1
+                        print(f"⚠️ Crawl failed for {url}: {e}")
+                        continue
+                    if page is None:
+                        self.stats.skipped += 1
+                        continue
+                    self.stats.visited.append(url)
+                    try:
+                        ingested = on_page(page)
+                    except Exception as e:
+                        self.stats.errors += 1
+                        print(f"⚠️ Ingest failed for {url}: {e}")
+                        continue
+                    if self.cache and resp is not None:
+                        self.cache.store(url, resp)
+                    elif self.cache and ingested:
+                        self.cache.touch(url)
+                    for link in links:
+                        link = normalize_url(link)
+                        if link not in seen and self._in_scope(link):
+                            seen.add(link)
+                            frontier.append((link, depth + 1))
+        self.session.close()
+        return self.stats
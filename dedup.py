@@ -0,0 +1,170 @@
+# dedup.py - Near-duplicate chunk detection with MinHash + LSH
+import os
+import re
+import time
+import zlib
+import random
+import hashlib
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from storage import DATA_DIR, SQLiteStore
+
+# ---------- Config ----------
+DEDUP_DB_PATH = os.getenv("YCOTES_DEDUP_DB", os.path.join(DATA_DIR, "dedup.db"))
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sketches (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    expires_at REAL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    band INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_buckets ON buckets(band, key);
+CREATE INDEX IF NOT EXISTS idx_buckets_id ON buckets(id);
+CREATE TABLE IF NOT EXISTS aliases (
+    canonical_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    similarity REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_aliases_canonical ON aliases(canonical_id);
+"""
+
+
+def shingles(text: str, k: int = SHINGLE_WORDS) -> set:
+    """Hashed k-word shingles of lowercased text."""
+    words = _WORD.findall(text.lower())
+    if len(words) <= k:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))}
+    return {zlib.crc32(" ".join(words[i:i + k]).encode("utf-8")) for i in range(len(words) - k + 1)}
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) whose S-curve midpoint sits closest to, but not above, the threshold."""
+    best = (num_perm, 1)
+    best_gap = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        midpoint = (1.0 / bands) ** (1.0 / rows)
+        if midpoint <= threshold and threshold - midpoint < best_gap:
+            best, best_gap = (bands, rows), threshold - midpoint
+    return best
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = shingles(text)
+        return tuple(min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes) for a, b in self.perms)
+
+
+def jaccard_estimate(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class DedupIndex(SQLiteStore):
+    """Persistent MinHash/LSH index over every chunk ingested so far."""
+
+    def __init__(self, path: str = DEDUP_DB_PATH, threshold: float = 0.85, num_perm: int = NUM_PERM):
+        super().__init__(path, SCHEMA)
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+
+    def _band_keys(self, signature: Sequence[int]) -> List[Tuple[int, int]]:
+        keys = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(array("Q", chunk).tobytes(), digest_size=8).digest()
+            keys.append((band, int.from_bytes(digest, "big", signed=True)))
+        return keys
+
+    def check(self, text: str, now: Optional[float] = None) -> Tuple[Optional[str], float, Tuple[int, ...]]:
+        """Return (canonical_id, similarity, signature); canonical_id is None when nothing is close."""
+        now = time.time() if now is None else now
+        signature = self.hasher.signature(text)
+        conn = self._conn()
+        candidates = set()
+        for band, key in self._band_keys(signature):
+            for (cand,) in conn.execute("SELECT id FROM buckets WHERE band = ? AND key = ?", (band, key)):
+                candidates.add(cand)
+
+        best_id, best_sim = None, 0.0
+        for cand in candidates:
+            row = conn.execute("SELECT signature, expires_at FROM sketches WHERE id = ?", (cand,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                continue
+            sim = jaccard_estimate(signature, array("Q", row[0]))
+            if sim > best_sim:
+                best_id, best_sim = cand, sim
+        if best_sim >= self.threshold:
+            return best_id, best_sim, signature
+        return None, best_sim, signature
+
+    def add(self, vec_id: str, source: str, signature: Sequence[int], expires_at: Optional[float] = None):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sketches (id, source, signature, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (vec_id, source, array("Q", signature).tobytes(), expires_at, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO buckets (band, key, id) VALUES (?, ?, ?)",
+                [(band, key, vec_id) for band, key in self._band_keys(signature)],
+            )
+
+    def expiring_before(self, ids: Sequence[str], expires_at: Optional[float]) -> List[str]:
+        """The given sketches that expire before `expires_at` (None: never)."""
+        conn = self._conn()
+        out = []
+        for vec_id in ids:
+            row = conn.execute("SELECT expires_at FROM sketches WHERE id = ?", (vec_id,)).fetchone()
+            if row and row[0] is not None and (expires_at is None or row[0] < expires_at):
+                out.append(vec_id)
+        return out
+
+    def set_expiry(self, ids: Sequence[str], expires_at: Optional[float]):
+        conn = self._conn()
+        with conn:
+            conn.executemany("UPDATE sketches SET expires_at = ? WHERE id = ?", [(expires_at, i) for i in ids])
+
+    def remove(self, ids: Sequence[str]):
+        conn = self._conn()
+        with conn:
+            for vec_id in ids:
+                conn.execute("DELETE FROM sketches WHERE id = ?", (vec_id,))
+                conn.execute("DELETE FROM buckets WHERE id = ?", (vec_id,))
+
+    def add_alias(self, canonical_id: str, source: str, title: str, similarity: float):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO aliases (canonical_id, source, title, similarity, created_at) VALUES (?, ?, ?, ?, ?)",
+                (canonical_id, source, title, similarity, time.time()),
+            )
+
+    def aliases(self, canonical_id: str) -> List[Dict[str, object]]:
+        rows = self._conn().execute(
+            "SELECT source, title, similarity FROM aliases WHERE canonical_id = ? ORDER BY created_at",
+            (canonical_id,),
+        ).fetchall()
+        return [{"source": s, "title": t, "similarity": sim} for s, t, sim in rows]
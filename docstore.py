@@ -0,0 +1,175 @@
+# docstore.py
+import os
+import time
+import zlib
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from storage import DATA_DIR, SQLiteStore
+
+# ---------- Config ----------
+DOCSTORE_PATH = os.getenv("YCOTES_DOCSTORE", os.path.join(DATA_DIR, "docstore.db"))
+COMPRESS_MIN_CHARS = 256   # shorter chunks are stored as-is
+SQL_BATCH = 500            # stay well below SQLite's bound-parameter limit
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    title TEXT NOT NULL,
+    body BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    doc TEXT,
+    canonical_id TEXT,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks(source, created_at);
+"""
+# Columns added after the first release; older docstore files get them on open
+ADDED_COLUMNS = (("doc", "TEXT"), ("canonical_id", "TEXT"), ("expires_at", "REAL"))
+COLUMNS = "id, source, title, body, compressed, created_at, doc, canonical_id, expires_at"
+_PLACEHOLDERS = ", ".join("?" * len(COLUMNS.split(", ")))
+
+
+def _encode(text: str):
+    raw = text.encode("utf-8")
+    if len(text) >= COMPRESS_MIN_CHARS:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return packed, 1
+    return raw, 0
+
+
+def _decode(body: bytes, compressed: int) -> str:
+    return (zlib.decompress(body) if compressed else bytes(body)).decode("utf-8")
+
+
+class DocStore(SQLiteStore):
+    """Chunk text keyed by vector ID, kept out of the vector index metadata.
+
+    Every ingest of a document (a file, or one page of a site) writes a new
+    generation of rows sharing its `created_at`. A chunk the ingest skipped as
+    a near-duplicate is stored as a row pointing at its `canonical_id`, so the
+    document can still be read back whole and in order.
+    """
+
+    def __init__(self, path: str = DOCSTORE_PATH):
+        super().__init__(path, SCHEMA)
+        conn = self._conn()
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+        with conn:
+            for name, decl in ADDED_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE chunks ADD COLUMN {name} {decl}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_canonical ON chunks(canonical_id)")
+
+    def put_many(self, records: Sequence[Dict[str, Any]]):
+        """Store records with keys id, source, title, text and optionally doc, canonical_id,
+        created_at, expires_at (replacing existing IDs)."""
+        now = time.time()
+        rows = []
+        for rec in records:
+            body, compressed = _encode(rec["text"])
+            rows.append((rec["id"], rec.get("source", "unknown"), rec.get("title", ""), body, compressed,
+                         rec.get("created_at", now), rec.get("doc"), rec.get("canonical_id"),
+                         rec.get("expires_at")))
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO chunks ({COLUMNS}) VALUES ({_PLACEHOLDERS})",
+                rows,
+            )
+
+    def get_many(self, ids: Sequence[str]) -> Dict[str, str]:
+        """Batch-fetch chunk text. IDs that are not stored are simply absent from the result."""
+        out: Dict[str, str] = {}
+        conn = self._conn()
+        ids = list(ids)
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start:start + SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            for vec_id, body, compressed in conn.execute(
+                f"SELECT id, body, compressed FROM chunks WHERE id IN ({marks})", batch
+            ):
+                out[vec_id] = _decode(body, compressed)
+        return out
+
+    def iter_source(self, source: str, now: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the chunks of the latest ingest of each of a source's documents, in ingest order.
+
+        Expired rows are deleted first. Duplicate rows yield their canonical
+        chunk's text, and are dropped once that chunk has expired. Rows written
+        before documents were tracked (doc IS NULL) are all kept.
+        """
+        now = time.time() if now is None else now
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM chunks WHERE source = ? AND expires_at <= ?", (source, now))
+        rows = conn.execute(
+            """
+            WITH latest AS (
+                SELECT doc, MAX(created_at) AS created_at FROM chunks
+                WHERE source = ? AND doc IS NOT NULL GROUP BY doc
+            )
+            SELECT c.id, c.title, COALESCE(k.body, c.body), COALESCE(k.compressed, c.compressed)
+            FROM chunks c
+            LEFT JOIN latest l ON l.doc = c.doc
+            LEFT JOIN chunks k ON k.id = c.canonical_id
+            WHERE c.source = ?
+              AND (c.doc IS NULL OR c.created_at = l.created_at)
+              AND (c.canonical_id IS NULL OR (k.id IS NOT NULL AND (k.expires_at IS NULL OR k.expires_at > ?)))
+            ORDER BY c.created_at, c.rowid
+            """,
+            (source, source, now),
+        )
+        for vec_id, title, body, compressed in rows:
+            yield {"id": vec_id, "title": title, "text": _decode(body, compressed)}
+
+    def iter_texts(self, after_rowid: int = 0) -> Iterator[Tuple[int, str]]:
+        """Yield (rowid, text) for chunks stored after `after_rowid`, oldest first. Duplicate rows are skipped."""
+        rows = self._conn().execute(
+            "SELECT rowid, body, compressed FROM chunks WHERE rowid > ? AND canonical_id IS NULL ORDER BY rowid",
+            (after_rowid,),
+        )
+        for rowid, body, compressed in rows:
+            yield rowid, _decode(body, compressed)
+
+    def copy_to(self, path: str, ids: Sequence[str]) -> int:
+        """Copy the given chunks (still compressed), and the duplicate rows pointing at them, into another
+        docstore file."""
+        dest = DocStore(path)
+        conn, dest_conn = self._conn(), dest._conn()
+        copied = 0
+        ids = list(ids)
+        with dest_conn:
+            step = SQL_BATCH // 2   # each ID is bound twice
+            for start in range(0, len(ids), step):
+                batch = ids[start:start + step]
+                marks = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT {COLUMNS} FROM chunks WHERE id IN ({marks}) OR canonical_id IN ({marks})", batch * 2
+                ).fetchall()
+                dest_conn.executemany(
+                    f"INSERT OR REPLACE INTO chunks ({COLUMNS}) VALUES ({_PLACEHOLDERS})",
+                    rows,
+                )
+                copied += len(rows)
+        return copied
+
+    def extend_expiry(self, ids: Sequence[str], expires_at: Optional[float]):
+        conn = self._conn()
+        ids = list(ids)
+        with conn:
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                conn.execute(f"UPDATE chunks SET expires_at = ? WHERE id IN ({','.join('?' * len(batch))})",
+                             [expires_at, *batch])
+
+    def delete_many(self, ids: Sequence[str]):
+        conn = self._conn()
+        ids = list(ids)
+        with conn:
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+
@@ -0,0 +1,123 @@
+# embed_batcher.py
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Tuple
+
+# embed_many(texts) -> (vectors in input order, total prompt tokens)
+EmbedMany = Callable[[List[str]], Tuple[List[List[float]], int]]
+
+
+class EmbeddingBatcher:
+    """Gathers embedding requests from many threads into batched upstream calls.
+
+    The first request starts a window of `window_ms`; everything that arrives
+    before it closes (or until `max_batch` items) is sent as one request and the
+    vectors are fanned back out to the waiting callers.
+    """
+
+    def __init__(self, embed_many: EmbedMany, window_ms: float = 10.0, max_batch: int = 64,
+                 stats_window: int = 1000):
+        self.embed_many = embed_many
+        self.window_sec = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._pending: "queue.Queue[Tuple[str, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waits_ms: Deque[float] = deque(maxlen=stats_window)
+        self._upstream_ms: Deque[float] = deque(maxlen=stats_window)
+        self.items = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> "Future[Tuple[List[float], int]]":
+        # Rejected here: the upstream API fails the whole request for one empty input
+        if not text or not text.strip():
+            raise ValueError("Cannot embed empty text")
+        self._ensure_started()
+        fut: Future = Future()
+        self._pending.put((text, fut, time.monotonic()))
+        return fut
+
+    def embed(self, text: str) -> Tuple[List[float], int]:
+        return self.submit(text).result()
+
+    def _collect(self) -> List[Tuple[str, Future, float]]:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window_sec
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._send(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # One bad input fails the whole upstream request: retry each item alone so only it fails
+                for item in batch:
+                    try:
+                        self._send([item])
+                    except Exception as item_error:
+                        item[1].set_exception(item_error)
+
+    def _send(self, batch: List[Tuple[str, Future, float]]):
+        texts = [text for text, _, _ in batch]
+        started = time.monotonic()
+        vectors, tokens = self.embed_many(texts)
+        done = time.monotonic()
+
+        # Attribute the batch's tokens to callers in proportion to their text length
+        total_chars = sum(len(t) for t in texts) or 1
+        for (text, fut, _), vec in zip(batch, vectors):
+            fut.set_result((vec, round(tokens * len(text) / total_chars)))
+
+        with self._stats_lock:
+            self.items += len(batch)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self._upstream_ms.append((done - started) * 1000.0)
+            self._waits_ms.extend((started - queued) * 1000.0 for _, _, queued in batch)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            waits = sorted(self._waits_ms)
+            upstream = list(self._upstream_ms)
+            items, batches = self.items, self.batches
+            largest = self.largest_batch
+
+        def pct(values: List[float], p: float) -> float:
+            return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+        return {
+            "window_ms": self.window_sec * 1000.0,
+            "max_batch": self.max_batch,
+            "items": items,
+            "upstream_requests": batches,
+            "avg_batch_size": items / batches if batches else 0.0,
+            "largest_batch": largest,
+            "wait_ms_p50": pct(waits, 0.50),
+            "wait_ms_p95": pct(waits, 0.95),
+            "upstream_ms_avg": sum(upstream) / len(upstream) if upstream else 0.0,
+        }
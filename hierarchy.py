@@ -0,0 +1,105 @@
+# hierarchy.py - Section-level helpers for two-level (section -> chunk) retrieval
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+SECTION_CHUNK_CHARS = 1500       # target size of the chunks a section is split into
+CACHE_SIMILARITY = 0.85          # reuse a session's sections for questions at least this similar
+CACHE_TTL_SEC = 30 * 60
+CACHE_ENTRIES_PER_SESSION = 8
+CACHE_MAX_SESSIONS = 1000
+
+
+def split_section(content: str, max_chars: int = SECTION_CHUNK_CHARS) -> List[str]:
+    """Pack a section's paragraphs into chunks of about max_chars.
+
+    Paragraphs are never cut, so a single oversized paragraph (e.g. a table
+    chunk) stays whole.
+    """
+    parts, current, size = [], [], 0
+    for para in content.split("\n\n"):
+        if not para.strip():
+            continue
+        if current and size + len(para) + 2 > max_chars:
+            parts.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(para)
+        size += len(para) + 2
+    if current:
+        parts.append("\n\n".join(current))
+    return parts
+
+
+def _unit(vec: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+class SectionCentroids:
+    """Accumulates chunk vectors per section; the unit-norm mean is the section's summary vector."""
+
+    def __init__(self):
+        self._sums: Dict[str, List[float]] = {}
+        self._meta: Dict[str, Dict] = {}
+
+    def add(self, section_id: str, vec: Sequence[float], metadata: Dict):
+        acc = self._sums.get(section_id)
+        if acc is None:
+            self._sums[section_id] = list(_unit(vec))
+            self._meta[section_id] = dict(metadata, n_chunks=1)
+        else:
+            for i, x in enumerate(_unit(vec)):
+                acc[i] += x
+            self._meta[section_id]["n_chunks"] += 1
+
+    def items(self, section_ids: Optional[Iterable[str]] = None):
+        """(section_id, centroid, metadata) for every section, or only for `section_ids`."""
+        for section_id in (self._sums if section_ids is None else section_ids):
+            yield section_id, _unit(self._sums[section_id]), self._meta[section_id]
+
+
+class SectionCache:
+    """Per-session cache of coarse (section-level) results.
+
+    Follow-up questions in a session usually stay on the same sections, so a
+    query whose embedding is close to a cached one reuses its sections, stored
+    as (section_id, n_chunks) pairs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, List[tuple]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, session_id: Optional[str], qvec: Sequence[float]) -> Optional[List[Tuple[str, int]]]:
+        if not session_id:
+            return None
+        q = _unit(qvec)
+        now = time.time()
+        with self._lock:
+            entries = self._sessions.get(session_id, [])
+            for cached_vec, sections, stored_at in entries:
+                if now - stored_at < CACHE_TTL_SEC and sum(a * b for a, b in zip(q, cached_vec)) >= CACHE_SIMILARITY:
+                    self._sessions.move_to_end(session_id)
+                    self.hits += 1
+                    return sections
+            self.misses += 1
+            return None
+
+    def store(self, session_id: Optional[str], qvec: Sequence[float], sections: List[Tuple[str, int]]):
+        if not session_id:
+            return
+        with self._lock:
+            entries = self._sessions.setdefault(session_id, [])
+            entries.insert(0, (_unit(qvec), sections, time.time()))
+            del entries[CACHE_ENTRIES_PER_SESSION:]
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > CACHE_MAX_SESSIONS:
+                self._sessions.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "sessions": len(self._sessions)}
@@ -0,0 +1,232 @@
+# index_snapshot.py - Export / load / restore the knowledge base without re-embedding
+#
+# Snapshot layout (one directory):
+#   manifest.json     embed model, dimension, metric, namespace, row count
+#   vectors.npy       float32 (count, dimension) unit-norm matrix, memory-mapped on load
+#   codes_int8.npy    precomputed int8 codes  } optional, so loading does not
+#   scales.npy        per-row int8 scales     } need to re-quantize
+#   metadata.jsonl    one {"id": ..., "metadata": {...}} per row, same order as vectors
+#   docstore.db       chunk text for the exported IDs (optional, see docstore.py)
+#   sections/         the section-vector namespace in this same layout (optional, see hierarchy.py)
+#
+# CLI:
+#   python index_snapshot.py export  <dir>   # live Pinecone namespace -> snapshot
+#   python index_snapshot.py restore <dir>   # snapshot -> Pinecone (bulk upsert)
+#   python index_snapshot.py info    <dir>
+import os
+import sys
+import json
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from docstore import DocStore
+from local_index import QuantizedIndex, normalize_rows, quantize_int8
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+CODES_FILE = "codes_int8.npy"
+SCALES_FILE = "scales.npy"
+METADATA_FILE = "metadata.jsonl"
+DOCSTORE_FILE = "docstore.db"
+SECTIONS_DIR = "sections"
+FETCH_BATCH = 100
+UPSERT_BATCH = 100
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for index snapshots. Run: pip install numpy")
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _vector_fields(vec) -> Tuple[List[float], Dict[str, Any]]:
+    """Values and metadata from a fetched vector (object in Pinecone v3+, dict in v2)."""
+    if isinstance(vec, dict):
+        return vec["values"], vec.get("metadata") or {}
+    return vec.values, dict(vec.metadata or {})
+
+
+def _list_ids(index, namespace: str) -> List[str]:
+    if not hasattr(index, "list"):
+        raise RuntimeError("Snapshot export needs Pinecone SDK v3+ (index.list)")
+    ids: List[str] = []
+    for page in index.list(namespace=namespace):
+        ids.extend(page)
+    return ids
+
+
+# ---------- Export ----------
+def export_snapshot(index, path: str, namespace: str, embed_model: str, dimension: int,
+                    metric: str = "cosine", docstore=None, section_namespace: Optional[str] = None) -> Dict[str, Any]:
+    """Write every vector in `namespace` to a snapshot directory. Returns the manifest.
+
+    When `docstore` is given, the chunk text for the exported IDs is copied alongside.
+    When `section_namespace` is given, its section vectors are exported to `sections/`.
+    """
+    _require_numpy()
+    os.makedirs(path, exist_ok=True)
+    ids = _list_ids(index, namespace)
+    print(f"📦 Exporting {len(ids)} vectors from namespace '{namespace}'...")
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(len(ids), dimension)
+    )
+    count = 0
+    exported_ids: List[str] = []
+    with open(os.path.join(path, METADATA_FILE), "w", encoding="utf-8") as meta_out:
+        for start in range(0, len(ids), FETCH_BATCH):
+            batch = ids[start:start + FETCH_BATCH]
+            res = index.fetch(ids=batch, namespace=namespace)
+            fetched = res["vectors"] if isinstance(res, dict) else res.vectors
+            for vec_id in batch:
+                if vec_id not in fetched:  # deleted between list and fetch
+                    continue
+                values, metadata = _vector_fields(fetched[vec_id])
+                vectors[count] = values
+                meta_out.write(json.dumps({"id": vec_id, "metadata": metadata}, ensure_ascii=False) + "\n")
+                exported_ids.append(vec_id)
+                count += 1
+            print(f" ✅ {count}/{len(ids)} vectors exported")
+
+    # Normalize and precompute int8 codes so replicas load without touching every row
+    for start in range(0, count, 8192):
+        vectors[start:start + 8192] = normalize_rows(vectors[start:start + 8192])
+    vectors.flush()
+    codes, scales = quantize_int8(vectors[:count])
+    np.save(os.path.join(path, CODES_FILE), codes)
+    np.save(os.path.join(path, SCALES_FILE), scales)
+    del vectors
+    if docstore is not None:
+        copied = docstore.copy_to(os.path.join(path, DOCSTORE_FILE), exported_ids)
+        print(f" ✅ {copied} chunk texts copied to snapshot docstore")
+    if section_namespace:
+        export_snapshot(index, os.path.join(path, SECTIONS_DIR), section_namespace, embed_model, dimension, metric)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "embed_model": embed_model,
+        "dimension": dimension,
+        "metric": metric,
+        "namespace": namespace,
+        "count": count,
+        "created_at": int(time.time()),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"✅ Snapshot written to {path} ({count} vectors)")
+    return manifest
+
+
+# ---------- Load ----------
+def iter_snapshot(path: str) -> Iterator[Tuple[str, "np.ndarray", Dict[str, Any]]]:
+    _require_numpy()
+    manifest = read_manifest(path)
+    vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+        for row, line in enumerate(f):
+            if row >= manifest["count"]:
+                break
+            rec = json.loads(line)
+            yield rec["id"], vectors[row], rec["metadata"]
+
+
+def load_snapshot(path: str, expected_model: Optional[str] = None, expected_dimension: Optional[int] = None,
+                  quantization: str = "int8") -> QuantizedIndex:
+    """Open a snapshot as a QuantizedIndex. Vectors and codes are memory-mapped, not copied."""
+    _require_numpy()
+    manifest = read_manifest(path)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    if expected_model and manifest["embed_model"] != expected_model:
+        raise ValueError(f"Snapshot embedded with {manifest['embed_model']}, expected {expected_model}")
+    if expected_dimension and manifest["dimension"] != expected_dimension:
+        raise ValueError(f"Snapshot dimension {manifest['dimension']}, expected {expected_dimension}")
+
+    started = time.time()
+    count = manifest["count"]
+    vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")[:count]
+    codes = scales = None
+    if quantization == "int8" and os.path.exists(os.path.join(path, CODES_FILE)):
+        codes = np.load(os.path.join(path, CODES_FILE), mmap_mode="r")
+        scales = np.load(os.path.join(path, SCALES_FILE), mmap_mode="r")
+
+    ids, metadata = [], []
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as f:
+        for line in f:
+            if len(ids) >= count:
+                break
+            rec = json.loads(line)
+            ids.append(rec["id"])
+            metadata.append(rec["metadata"])
+
+    idx = QuantizedIndex(ids, vectors, metadata, quantization=quantization, normalized=True,
+                         codes=codes, scales=scales)
+    print(f"✅ Loaded snapshot {path}: {count} vectors in {time.time() - started:.2f}s")
+    return idx
+
+
+# ---------- Restore ----------
+def restore_snapshot(index, path: str, namespace: str, expected_model: Optional[str] = None,
+                     expected_dimension: Optional[int] = None, section_namespace: Optional[str] = None,
+                     docstore_path: Optional[str] = None) -> int:
+    """Bulk upsert a snapshot into a Pinecone index. Returns the number of vectors restored.
+
+    When `section_namespace` is given and the snapshot has a `sections/` export, it is restored there too.
+    When `docstore_path` is given, the snapshot's chunk text is merged into that docstore; the vectors
+    carry no text of their own, so without it restored matches have nothing to answer from.
+    """
+    manifest = read_manifest(path)
+    if expected_model and manifest["embed_model"] != expected_model:
+        raise ValueError(f"Snapshot embedded with {manifest['embed_model']}, index expects {expected_model}")
+    if expected_dimension and manifest["dimension"] != expected_dimension:
+        raise ValueError(f"Snapshot dimension {manifest['dimension']}, index expects {expected_dimension}")
+    batch, restored, restored_ids = [], 0, []
+    for vec_id, values, metadata in iter_snapshot(path):
+        batch.append((vec_id, values.tolist(), metadata))
+        restored_ids.append(vec_id)
+        if len(batch) >= UPSERT_BATCH:
+            index.upsert(vectors=batch, namespace=namespace)
+            restored += len(batch)
+            batch = []
+    if batch:
+        index.upsert(vectors=batch, namespace=namespace)
+        restored += len(batch)
+    print(f"✅ Restored {restored} vectors into namespace '{namespace}'")
+    snapshot_docs = os.path.join(path, DOCSTORE_FILE)
+    if docstore_path and os.path.exists(snapshot_docs):
+        copied = DocStore(snapshot_docs).copy_to(docstore_path, restored_ids)
+        print(f" ✅ {copied} chunk texts merged into {docstore_path}")
+    sections_path = os.path.join(path, SECTIONS_DIR)
+    if section_namespace and os.path.exists(os.path.join(sections_path, MANIFEST_FILE)):
+        restore_snapshot(index, sections_path, section_namespace, expected_model, expected_dimension)
+    return restored
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "restore", "info"):
+        print("Usage: python index_snapshot.py [export|restore|info] <snapshot_dir>")
+        sys.exit(1)
+    command, snapshot_dir = sys.argv[1], sys.argv[2]
+    if command == "info":
+        print(json.dumps(read_manifest(snapshot_dir), indent=2))
+        sys.exit(0)
+
+    import backend_rag
+    if command == "export":
+        export_snapshot(backend_rag.index, snapshot_dir, backend_rag.NAMESPACE, backend_rag.EMBED_MODEL,
+                        backend_rag.DIMENSION, backend_rag.METRIC, docstore=backend_rag.get_docstore(),
+                        section_namespace=backend_rag.SECTION_NAMESPACE)
+    else:
+        restore_snapshot(backend_rag.index, snapshot_dir, backend_rag.NAMESPACE, backend_rag.EMBED_MODEL,
+                         backend_rag.DIMENSION, section_namespace=backend_rag.SECTION_NAMESPACE,
+                         docstore_path=backend_rag.DOCSTORE_PATH)
@@ -0,0 +1,266 @@
+# ingest_jobs.py - Process-level background queue for ingestion work
+import os
+import time
+import uuid
+import queue
+import threading
+import contextvars
+from dataclasses import dataclass, asdict, fields
+from typing import Any, Callable, Dict, List, Optional
+
+from storage import DATA_DIR, SQLiteStore
+
+# ---------- Config ----------
+JOBS_DB_PATH = os.getenv("YCOTES_JOBS_DB", os.path.join(DATA_DIR, "jobs.db"))
+JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+JOB_QUEUE_DEPTH = int(os.getenv("INGEST_JOB_QUEUE_DEPTH", "16"))   # queued (not yet running) jobs per process
+PERSIST_INTERVAL_SEC = 1.0    # progress is written to SQLite at most this often per job
+ACTIVE_STATUSES = ("queued", "running")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    kind TEXT NOT NULL,
+    label TEXT NOT NULL,
+    source TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pages INTEGER NOT NULL DEFAULT 0,
+    chunks INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    result INTEGER,
+    error TEXT,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, created_at);
+"""
+
+
+@dataclass
+class IngestJob:
+    id: str
+    session_id: Optional[str]
+    kind: str                  # file | url | crawl
+    label: str                 # what the user submitted (file name / URL)
+    source: str                # vector-store source tag
+    status: str = "queued"     # queued | running | done | failed | interrupted
+    pages: int = 0
+    chunks: int = 0
+    tokens: int = 0
+    cost_usd: float = 0.0
+    result: Optional[int] = None
+    error: Optional[str] = None
+    pid: int = 0
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+
+_JOB_FIELDS = [f.name for f in fields(IngestJob)]
+
+# The job the current worker thread is running; ingest code reports progress against it
+current_job: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_job", default=None)
+
+
+def report_progress(pages: int = 0, chunks: int = 0, tokens: int = 0, cost_usd: float = 0.0):
+    """Add to the running job's counters. A no-op outside a job, e.g. in synchronous ingests."""
+    job_id = current_job.get()
+    if job_id is not None and _queue is not None:
+        _queue.add_progress(job_id, pages=pages, chunks=chunks, tokens=tokens, cost_usd=cost_usd)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class QueueFull(Exception):
+    def __init__(self, depth: int):
+        super().__init__(f"ingest job queue is full ({depth} jobs waiting); try again shortly")
+        self.depth = depth
+
+
+class JobQueue(SQLiteStore):
+    """FIFO of ingest jobs drained by a fixed set of worker threads.
+
+    At most `queue_depth` jobs wait at once; further submissions raise QueueFull.
+    Live progress is kept in memory and mirrored to SQLite, so a job can be looked
+    up after a Streamlit rerun, a browser refresh, or from another API worker.
+    """
+
+    def __init__(self, path: str = JOBS_DB_PATH, workers: int = JOB_WORKERS, queue_depth: int = JOB_QUEUE_DEPTH):
+        super().__init__(path, SCHEMA)
+        self.queue_depth = max(1, queue_depth)
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, IngestJob] = {}
+        self._persisted_at: Dict[str, float] = {}
+        self._pending: "queue.Queue[tuple]" = queue.Queue()
+        self._mark_orphans()
+        self._workers = [
+            threading.Thread(target=self._work_loop, name=f"ingest-job-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._workers:
+            t.start()
+
+    def _mark_orphans(self):
+        """Jobs left queued/running by a process that has since exited can never finish."""
+        conn = self._conn()
+        rows = conn.execute(
+            f"SELECT id, pid FROM jobs WHERE status IN ({','.join('?' * len(ACTIVE_STATUSES))})", ACTIVE_STATUSES
+        ).fetchall()
+        dead = [(time.time(), job_id) for job_id, pid in rows if pid == os.getpid() or not _pid_alive(pid)]
+        if dead:
+            with conn:
+                conn.executemany(
+                    "UPDATE jobs SET status = 'interrupted', error = 'worker process exited', finished_at = ? "
+                    "WHERE id = ?", dead)
+
+    def _persist(self, job: IngestJob, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._persisted_at.get(job.id, 0.0) < PERSIST_INTERVAL_SEC:
+            return
+        self._persisted_at[job.id] = now
+        row = asdict(job)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(_JOB_FIELDS)}) VALUES ({', '.join('?' * len(_JOB_FIELDS))})",
+                [row[name] for name in _JOB_FIELDS],
+            )
+
+    # ---------- Submitting ----------
+    def _queued(self) -> int:
+        return sum(job.status == "queued" for job in self._jobs.values())
+
+    def check(self):
+        """Raise QueueFull if a job submitted now would be rejected.
+
+        Lets callers refuse before expensive work such as saving an upload;
+        `submit` still enforces the limit itself.
+        """
+        with self._lock:
+            if self._queued() < self.queue_depth:
+                return
+            self.rejected += 1
+        raise QueueFull(self.queue_depth)
+
+    def submit(self, kind: str, label: str, source: str, fn: Callable[..., int], *args,
+               session_id: Optional[str] = None, on_finish: Optional[Callable[[IngestJob], None]] = None,
+               **kwargs) -> str:
+        """Queue fn(*args, **kwargs) and return its job ID immediately.
+
+        fn runs in a copy of the caller's context (so cost attribution carries
+        over) and should return the number of chunks ingested. `on_finish` runs
+        on the worker thread once the job ends, whatever its outcome; it is not
+        called when the queue is full and QueueFull is raised instead.
+        """
+        job = IngestJob(id=uuid.uuid4().hex, session_id=session_id, kind=kind, label=label, source=source,
+                        pid=os.getpid(), created_at=time.time())
+        with self._lock:
+            if self._queued() >= self.queue_depth:
+                self.rejected += 1
+                raise QueueFull(self.queue_depth)
+            self._jobs[job.id] = job
+            self._persist(job, force=True)
+        self._pending.put((job.id, contextvars.copy_context(), fn, args, kwargs, on_finish))
+        return job.id
+
+    def _work_loop(self):
+        while True:
+            job_id, ctx, fn, args, kwargs, on_finish = self._pending.get()
+            ctx.run(self._run, job_id, fn, args, kwargs, on_finish)
+
+    def _run(self, job_id: str, fn: Callable[..., int], args: tuple, kwargs: dict,
+             on_finish: Optional[Callable[[IngestJob], None]]):
+        current_job.set(job_id)
+        self._update(job_id, status="running", started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            self._update(job_id, status="done", result=result, finished_at=time.time())
+        except Exception as e:
+            print(f"⚠️ Ingest job {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            if on_finish:
+                try:
+                    on_finish(self.get(job_id))
+                except Exception as e:
+                    print(f"⚠️ Ingest job {job_id} cleanup failed: {e}")
+            # The final state is in SQLite; only active jobs are kept in memory
+            with self._lock:
+                self._jobs.pop(job_id, None)
+                self._persisted_at.pop(job_id, None)
+
+    # ---------- Progress ----------
+    def _update(self, job_id: str, **changes):
+        with self._lock:
+            job = self._jobs[job_id]
+            for name, value in changes.items():
+                setattr(job, name, value)
+            self._persist(job, force=True)
+
+    def add_progress(self, job_id: str, **deltas):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            for name, value in deltas.items():
+                if value:
+                    setattr(job, name, getattr(job, name) + value)
+            self._persist(job)
+
+    # ---------- Reading ----------
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return IngestJob(**asdict(job))
+        row = self._conn().execute(
+            f"SELECT {', '.join(_JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return IngestJob(*row) if row else None
+
+    def list_jobs(self, session_id: str, limit: int = 20) -> List[IngestJob]:
+        """A session's most recent jobs, newest first, with live progress where available."""
+        rows = self._conn().execute(
+            f"SELECT {', '.join(_JOB_FIELDS)} FROM jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?",
+            (session_id, limit),
+        ).fetchall()
+        with self._lock:
+            return [IngestJob(**asdict(self._jobs[row[0]])) if row[0] in self._jobs else IngestJob(*row)
+                    for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = [j for j in self._jobs.values() if j.active]
+            return {"workers": len(self._workers), "queue_depth": self.queue_depth,
+                    "queued": sum(j.status == "queued" for j in active),
+                    "running": sum(j.status == "running" for j in active), "rejected": self.rejected}
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue shared by every session served by this worker."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
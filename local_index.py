@@ -0,0 +1,148 @@
+# local_index.py
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+QUANTIZATIONS = ("none", "int8", "binary")
+SEARCH_BLOCK_ROWS = 8192      # rows scored per block during the coarse pass
+DEFAULT_OVERSAMPLE = 4        # coarse candidates kept per requested result
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) if np is not None else None
+
+
+def normalize_rows(vectors: "np.ndarray") -> "np.ndarray":
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def quantize_int8(vectors: "np.ndarray"):
+    """Symmetric per-vector int8 codes. Returns (codes, scales) with x ≈ codes * scale."""
+    codes = np.empty(vectors.shape, dtype=np.int8)
+    scales = np.empty(vectors.shape[0], dtype=np.float32)
+    for start in range(0, vectors.shape[0], SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+        scale = np.abs(block).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes[start:start + len(block)] = np.rint(block / scale[:, None]).astype(np.int8)
+        scales[start:start + len(block)] = scale
+    return codes, scales
+
+
+def quantize_binary(vectors: "np.ndarray") -> "np.ndarray":
+    """Sign bits packed 8 per byte."""
+    out = np.empty((vectors.shape[0], (vectors.shape[1] + 7) // 8), dtype=np.uint8)
+    for start in range(0, vectors.shape[0], SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS])
+        out[start:start + len(block)] = np.packbits(block > 0, axis=1)
+    return out
+
+
+class QuantizedIndex:
+    """In-process cosine index with a quantized coarse pass and exact rescoring.
+
+    `vectors` holds the full-precision (unit-norm) matrix and may be a read-only
+    np.memmap: only the `top_k * oversample` coarse candidates are read from it,
+    so resident memory is dominated by the int8 / binary codes.
+    """
+
+    def __init__(self, ids: Sequence[str], vectors: "np.ndarray", metadata: Optional[List[Dict[str, Any]]] = None,
+                 quantization: str = "int8", oversample: int = DEFAULT_OVERSAMPLE, normalized: bool = False,
+                 codes: Optional["np.ndarray"] = None, scales: Optional["np.ndarray"] = None):
+        if np is None:
+            raise ImportError("numpy is required for the local index. Run: pip install numpy")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization: {quantization} (expected one of {QUANTIZATIONS})")
+        if len(ids) != vectors.shape[0]:
+            raise ValueError(f"{len(ids)} ids for {vectors.shape[0]} vectors")
+
+        self.ids = list(ids)
+        self.vectors = vectors if normalized else normalize_rows(vectors)
+        self.metadata = metadata if metadata is not None else [{} for _ in self.ids]
+        self.quantization = quantization
+        self.oversample = max(1, oversample)
+        self.dimension = vectors.shape[1]
+        self.expires_at = np.array(
+            [m.get("expires_at", np.inf) for m in self.metadata], dtype=np.float64
+        )
+
+        self.codes, self.scales = codes, scales
+        if quantization == "int8" and codes is None:
+            self.codes, self.scales = quantize_int8(self.vectors)
+        elif quantization == "binary" and codes is None:
+            self.codes = quantize_binary(self.vectors)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---------- Memory accounting ----------
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes for the coarse structures (kept resident) and the full-precision matrix."""
+        coarse = 0
+        if self.codes is not None:
+            coarse += self.codes.nbytes
+        if self.scales is not None:
+            coarse += self.scales.nbytes
+        return {"coarse": coarse, "full": int(self.vectors.nbytes)}
+
+    # ---------- Search ----------
+    def _coarse_scores(self, q: "np.ndarray", start: int, stop: int) -> "np.ndarray":
+        if self.quantization == "none":
+            return np.asarray(self.vectors[start:stop]) @ q
+        if self.quantization == "int8":
+            block = self.codes[start:stop].astype(np.float32)
+            return (block @ q) * self.scales[start:stop]
+        # binary: fewer differing sign bits ranks higher
+        qbits = np.packbits(q > 0)
+        diff = np.bitwise_xor(self.codes[start:stop], qbits)
+        return -_POPCOUNT[diff].sum(axis=1, dtype=np.int32).astype(np.float32)
+
+    def search(self, query: Sequence[float], top_k: int = 6, now: Optional[float] = None,
+               mask: Optional["np.ndarray"] = None) -> List[Dict[str, Any]]:
+        """Return up to top_k matches as {"id", "score", "metadata"} dicts, best first.
+
+        Vectors whose metadata `expires_at` is not after `now` are skipped; `mask`
+        optionally restricts the search to rows where it is True.
+        """
+        n = len(self.ids)
+        if n == 0 or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        now = time.time() if now is None else now
+
+        n_candidates = min(n, top_k * self.oversample) if self.quantization != "none" else min(n, top_k)
+        cand_idx = np.empty(0, dtype=np.int64)
+        cand_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            stop = min(n, start + SEARCH_BLOCK_ROWS)
+            scores = self._coarse_scores(q, start, stop).astype(np.float32)
+            valid = self.expires_at[start:stop] > now
+            if mask is not None:
+                valid &= mask[start:stop]
+            scores[~valid] = -np.inf
+            keep = min(n_candidates, stop - start)
+            part = np.argpartition(-scores, keep - 1)[:keep]
+            cand_idx = np.concatenate([cand_idx, part + start])
+            cand_scores = np.concatenate([cand_scores, scores[part]])
+            if len(cand_idx) > n_candidates:
+                best = np.argpartition(-cand_scores, n_candidates - 1)[:n_candidates]
+                cand_idx, cand_scores = cand_idx[best], cand_scores[best]
+
+        cand_idx = cand_idx[np.isfinite(cand_scores)]
+        if len(cand_idx) == 0:
+            return []
+
+        # Exact rescoring against full-precision vectors (sorted reads play well with memmaps)
+        cand_idx = np.sort(cand_idx)
+        exact = np.asarray(self.vectors[cand_idx], dtype=np.float32) @ q
+        order = np.argsort(-exact)[:top_k]
+        return [
+            {"id": self.ids[i], "score": float(exact[j]), "metadata": self.metadata[i]}
+            for j, i in ((j, int(cand_idx[j])) for j in order)
+        ]
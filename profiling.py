@@ -0,0 +1,244 @@
+# profiling.py - Opt-in sampling profiler for individual requests
+#
+# Enable with YCOTES_PROFILE=1 (whole process) or per session from the sidebar.
+# Each profiled call writes, under PROFILE_DIR:
+#   <ts>_<name>.speedscope.json   open at https://www.speedscope.app
+#   <ts>_<name>.folded.txt        collapsed stacks for flamegraph.pl / inferno
+#   <ts>_<name>.top.txt           top-N functions by self and total time
+# Only the newest KEEP_REPORTS reports are kept on disk.
+# When profiling is off, a wrapped call costs one ContextVar lookup.
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+import functools
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from storage import DATA_DIR
+
+# ---------- Config ----------
+PROFILE_ENABLED = os.getenv("YCOTES_PROFILE", "0") == "1"
+PROFILE_DIR = os.getenv("YCOTES_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+SAMPLE_INTERVAL_SEC = float(os.getenv("YCOTES_PROFILE_INTERVAL_MS", "5")) / 1000.0
+TOP_N = 25
+MAX_STACK_DEPTH = 200
+RECENT_REPORTS = 20        # kept in memory per session
+RECENT_SESSIONS = 100
+KEEP_REPORTS = int(os.getenv("YCOTES_PROFILE_KEEP", "50"))
+REPORT_SUFFIXES = (".speedscope.json", ".folded.txt", ".top.txt")
+
+# Set per session (sidebar switch) or inherited by jobs started from that session
+profiling_enabled: contextvars.ContextVar[bool] = contextvars.ContextVar("profiling_enabled", default=PROFILE_ENABLED)
+# The session reports are listed under; inherited like profiling_enabled
+profile_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("profile_session", default=None)
+
+Frame = Tuple[str, str, int]   # (function, file, first line)
+
+
+@dataclass
+class ProfileReport:
+    name: str
+    elapsed_ms: float
+    samples: int
+    top: List[str]
+    files: List[str]
+    session_id: Optional[str] = None
+
+
+_recent: "OrderedDict[Optional[str], Deque[ProfileReport]]" = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def _remember(report: ProfileReport):
+    with _recent_lock:
+        reports = _recent.get(report.session_id)
+        if reports is None:
+            reports = _recent[report.session_id] = deque(maxlen=RECENT_REPORTS)
+        reports.append(report)
+        _recent.move_to_end(report.session_id)
+        while len(_recent) > RECENT_SESSIONS:
+            _recent.popitem(last=False)
+
+
+def recent_reports(session_id: Optional[str] = None) -> List[ProfileReport]:
+    """Most recent reports written by this process for one session (None: outside any session), newest first."""
+    with _recent_lock:
+        return list(reversed(_recent.get(session_id, ())))
+
+
+# ---------- Sampler ----------
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds from a helper thread."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SEC):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames: List[Frame] = []
+        self._frame_ids: Dict[Frame, int] = {}
+        self.samples: List[Tuple[Tuple[int, ...], float]] = []   # (stack root-first, weight seconds)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        idx = self._frame_ids.get(key)
+        if idx is None:
+            idx = self._frame_ids[key] = len(self.frames)
+            self.frames.append(key)
+        return idx
+
+    def _loop(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            del frame
+            self.samples.append((tuple(reversed(stack)), now - last))
+            last = now
+
+
+# ---------- Output ----------
+def _label(frame: Frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def top_functions(sampler: StackSampler, n: int = TOP_N) -> List[str]:
+    total = sum(w for _, w in sampler.samples) or 1e-9
+    self_time: Counter = Counter()
+    incl_time: Counter = Counter()
+    for stack, weight in sampler.samples:
+        if not stack:
+            continue
+        self_time[stack[-1]] += weight
+        for idx in set(stack):
+            incl_time[idx] += weight
+    lines = [f"{'self %':>7} {'self ms':>9} {'total %':>8} {'total ms':>9}  function"]
+    for idx, t in self_time.most_common(n):
+        lines.append(f"{100 * t / total:>6.1f}% {t * 1000:>9.1f} {100 * incl_time[idx] / total:>7.1f}% "
+                     f"{incl_time[idx] * 1000:>9.1f}  {_label(sampler.frames[idx])}")
+    return lines
+
+
+def write_speedscope(sampler: StackSampler, name: str, elapsed_ms: float, path: str):
+    doc = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "ycotes-profiling",
+        "shared": {"frames": [{"name": fn, "file": file, "line": line} for fn, file, line in sampler.frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": elapsed_ms,
+            "samples": [list(stack) for stack, _ in sampler.samples],
+            "weights": [w * 1000 for _, w in sampler.samples],
+        }],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(doc, f)
+
+
+def write_folded(sampler: StackSampler, path: str):
+    folded: Counter = Counter()
+    for stack, weight in sampler.samples:
+        folded[";".join(_label(sampler.frames[i]).replace(";", ":") for i in stack)] += weight
+    with open(path, "w", encoding="utf-8") as f:
+        for line, weight in folded.most_common():
+            f.write(f"{line} {max(1, round(weight * 1000))}\n")   # weights in ms
+
+
+def _write_report(sampler: StackSampler, name: str, elapsed_ms: float) -> ProfileReport:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{safe}_{uuid.uuid4().hex[:6]}")
+    top = top_functions(sampler)
+    files = [base + suffix for suffix in REPORT_SUFFIXES]
+    write_speedscope(sampler, name, elapsed_ms, files[0])
+    write_folded(sampler, files[1])
+    with open(files[2], "w", encoding="utf-8") as f:
+        f.write(f"{name}: {elapsed_ms:.1f} ms, {len(sampler.samples)} samples\n\n" + "\n".join(top) + "\n")
+    _prune_reports()
+    return ProfileReport(name=name, elapsed_ms=elapsed_ms, samples=len(sampler.samples), top=top, files=files,
+                         session_id=profile_session.get())
+
+
+def _prune_reports(keep: int = KEEP_REPORTS):
+    """Delete all but the newest `keep` reports in PROFILE_DIR."""
+    reports: Dict[str, float] = {}
+    for entry in os.scandir(PROFILE_DIR):
+        for suffix in REPORT_SUFFIXES:
+            if entry.name.endswith(suffix):
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:   # pruned by another thread meanwhile
+                    continue
+                base = entry.path[:-len(suffix)]
+                reports[base] = max(reports.get(base, 0.0), mtime)
+    for base in sorted(reports, key=reports.get, reverse=True)[max(keep, 1):]:
+        for suffix in REPORT_SUFFIXES:
+            try:
+                os.remove(base + suffix)
+            except FileNotFoundError:
+                pass
+
+
+# ---------- Entry points ----------
+@contextmanager
+def profile_block(name: str) -> Iterator[None]:
+    """Profile the enclosed code when profiling is enabled; otherwise do nothing."""
+    if not profiling_enabled.get():
+        yield
+        return
+    # Nested blocks (e.g. answer() inside a profiled script run) each get their own sampler and report
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        yield
+    finally:
+        sampler.stop()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        try:
+            report = _write_report(sampler, name, elapsed_ms)
+            _remember(report)
+            print(f"🔬 Profile {name}: {elapsed_ms:.0f} ms, {report.samples} samples → {report.files[0]}")
+            for line in report.top[1:6]:
+                print(f"   {line}")
+        except OSError as e:
+            print(f"⚠️ Profile write failed: {e}")
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """Decorator form of profile_block."""
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled.get():
+                return fn(*args, **kwargs)
+            with profile_block(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,244 @@
+# query_router.py - Decide per question whether to retrieve and which chat model to use
+import os
+import re
+import json
+import time
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from storage import DATA_DIR, SQLiteStore
+
+# ---------- Config ----------
+ROUTER_DB_PATH = os.getenv("YCOTES_ROUTER_DB", os.path.join(DATA_DIR, "router.db"))
+ROUTER_LOG_PATH = os.getenv("YCOTES_ROUTER_LOG", os.path.join(DATA_DIR, "router_log.jsonl"))
+MIN_RETRIEVAL_OVERLAP = float(os.getenv("ROUTER_MIN_OVERLAP", "0.2"))
+ESCALATE_BELOW = float(os.getenv("ROUTER_ESCALATE_BELOW", "0.5"))
+VOCAB_REFRESH_SEC = 60        # background sync / reload of terms other worker processes ingested
+VOCAB_SEED_BATCH = 500        # docstore chunks read per vocabulary update while seeding
+SIMPLE_MAX_TERMS = 8          # content words in a question still considered "simple"
+EWMA_ALPHA = 0.2
+
+VOCAB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vocab (term TEXT PRIMARY KEY, df INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS vocab_sync (docstore TEXT PRIMARY KEY, last_rowid INTEGER NOT NULL);
+"""
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did doing have has had having i me my we our you your he she it
+its they them their this that these those what which who whom whose when where why how of in on at to for from by
+with about as into over under than then so if or and but not no nor can could would should will shall may might
+must please tell explain give show describe define meaning mean some any all each more most other such only own
+same too very just also there here up down out off again further once both few between through during before after
+above below
+""".split())
+GREETING = re.compile(
+    r"^\s*(hi|hello|hey|hii+|namaste|good (morning|afternoon|evening)|thanks|thank you|thx|ok(ay)?|bye|"
+    r"how are you|who are you|what('?s| is) your name)\b[\s!.?]*$",
+    re.IGNORECASE,
+)
+DEFINITION = re.compile(r"^\s*(what is|what are|what's|who is|who was|define|meaning of|full form of)\b", re.IGNORECASE)
+COMPLEX = re.compile(r"\b(why|how does|how do|compare|difference|differences|derive|prove|analy[sz]e|step by step|"
+                     r"evaluate|pros and cons|advantages|disadvantages|example|examples)\b", re.IGNORECASE)
+UNSURE = re.compile(r"(i('m| am) not sure|i don'?t know|i do not know|not enough (information|context)|"
+                    r"cannot (determine|answer)|unable to (answer|determine)|मुझे नहीं पता|निश्चित नहीं)", re.IGNORECASE)
+
+
+def content_terms(text: str) -> List[str]:
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS]
+
+
+@dataclass
+class RouteDecision:
+    retrieve: bool
+    model: str
+    confidence: float
+    reason: str
+    overlap: float
+
+
+# ---------- Corpus vocabulary ----------
+class CorpusVocabulary(SQLiteStore):
+    """Set of content terms seen in ingested chunks, persisted in SQLite.
+
+    With a `docstore`, the terms are read from its chunks: everything on first
+    use, then only chunks stored since the last sync. A background thread does
+    the syncing and reloads the terms other worker processes added, so routing
+    only reads the in-memory set. Until the first pass finishes the vocabulary
+    does not cover the corpus.
+    """
+
+    def __init__(self, path: str = ROUTER_DB_PATH, docstore=None):
+        super().__init__(path, VOCAB_SCHEMA)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._terms: Set[str] = set()
+        self.docstore = docstore
+        self._seeded = threading.Event()
+        self._wake = threading.Event()
+        if docstore is None:
+            self._seeded.set()
+        threading.Thread(target=self._refresh_loop, name="vocab-refresh", daemon=True).start()
+
+    def request_sync(self):
+        """Ask the background thread to sync now (e.g. after an ingest) without waiting for it."""
+        self._wake.set()
+
+    def _refresh_loop(self):
+        while True:
+            if self.docstore is not None:
+                try:
+                    added = self.sync()
+                except Exception as e:
+                    # Left unseeded until a later pass succeeds, so the router keeps retrieving for every question
+                    print(f"⚠️ Router vocabulary sync failed: {e}")
+                else:
+                    if added and not self._seeded.is_set():
+                        print(f"🧭 Router vocabulary updated from {added} stored chunks")
+                    self._seeded.set()
+            try:
+                terms = {row[0] for row in self._conn().execute("SELECT term FROM vocab")}
+                with self._lock:
+                    self._terms = terms
+            except Exception as e:
+                print(f"⚠️ Router vocabulary reload failed: {e}")
+            self._wake.wait(VOCAB_REFRESH_SEC)
+            self._wake.clear()
+
+    def sync(self) -> int:
+        """Add the terms of docstore chunks stored since the last sync. Returns the number of chunks read."""
+        if self.docstore is None:
+            return 0
+        key = os.path.abspath(self.docstore.path)
+        conn = self._conn()
+        with self._sync_lock:
+            row = conn.execute("SELECT last_rowid FROM vocab_sync WHERE docstore = ?", (key,)).fetchone()
+            last, added, batch = row[0] if row else 0, 0, []
+            for rowid, text in self.docstore.iter_texts(after_rowid=last):
+                batch.append(text)
+                last = rowid
+                if len(batch) >= VOCAB_SEED_BATCH:
+                    added += self._add_synced(batch, key, last)
+                    batch = []
+            if batch:
+                added += self._add_synced(batch, key, last)
+        return added
+
+    def _add_synced(self, texts: List[str], key: str, last_rowid: int) -> int:
+        self.add_documents(texts)
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO vocab_sync (docstore, last_rowid) VALUES (?, ?)", (key, last_rowid))
+        return len(texts)
+
+    def _terms_snapshot(self) -> Set[str]:
+        with self._lock:
+            return self._terms
+
+    def add_documents(self, texts: Iterable[str]):
+        counts: Dict[str, int] = {}
+        for text in texts:
+            for term in set(content_terms(text)):
+                counts[term] = counts.get(term, 0) + 1
+        if not counts:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO vocab (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                counts.items(),
+            )
+        with self._lock:
+            self._terms.update(counts)
+
+    def overlap(self, terms: List[str]) -> float:
+        if not terms:
+            return 0.0
+        vocab = self._terms_snapshot()
+        return sum(1 for t in terms if t in vocab) / len(terms)
+
+    def covers_corpus(self) -> bool:
+        """False while the vocabulary may be missing stored chunks: before seeding finishes, or when empty."""
+        return self._seeded.is_set() and bool(self._terms_snapshot())
+
+
+# ---------- Router ----------
+class QueryRouter:
+    def __init__(self, strong_model: str, fast_model: str, vocab: Optional[CorpusVocabulary] = None,
+                 log_path: str = ROUTER_LOG_PATH):
+        self.strong_model = strong_model
+        self.fast_model = fast_model
+        self.vocab = vocab or CorpusVocabulary()
+        self.log_path = log_path
+        self._latency: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def route(self, question: str, style: str = "concise") -> RouteDecision:
+        terms = content_terms(question)
+
+        if GREETING.match(question):
+            return RouteDecision(False, self.fast_model, 0.95, "greeting", 0.0)
+
+        # Non-Latin questions (e.g. Hindi) cannot be judged lexically: retrieve and use the strong model
+        if not re.search(r"[a-zA-Z]", question):
+            return RouteDecision(True, self.strong_model, 0.3, "non-latin script", 0.0)
+
+        overlap = self.vocab.overlap(terms)
+        if not self.vocab.covers_corpus():
+            # Judging overlap against a partial vocabulary would skip retrieval for indexed material
+            retrieve, why = True, "corpus vocabulary incomplete"
+        elif overlap < MIN_RETRIEVAL_OVERLAP:
+            retrieve, why = False, f"low corpus overlap {overlap:.2f}"
+        else:
+            retrieve, why = True, f"corpus overlap {overlap:.2f}"
+
+        simple = style == "concise" and len(terms) <= SIMPLE_MAX_TERMS and not COMPLEX.search(question)
+        confidence = 0.5
+        if DEFINITION.match(question):
+            confidence += 0.3
+        if len(terms) <= 4:
+            confidence += 0.1
+        if COMPLEX.search(question):
+            confidence -= 0.3
+        confidence = max(0.0, min(1.0, confidence))
+
+        if simple and confidence >= ESCALATE_BELOW:
+            return RouteDecision(retrieve, self.fast_model, confidence, why + ", simple question", overlap)
+        return RouteDecision(retrieve, self.strong_model, confidence, why + ", needs strong model", overlap)
+
+    @staticmethod
+    def looks_unsure(answer_text: str) -> bool:
+        return not answer_text.strip() or bool(UNSURE.search(answer_text))
+
+    # ---------- Latency bookkeeping ----------
+    def record_latency(self, stage: str, seconds: float):
+        with self._lock:
+            prev = self._latency.get(stage)
+            self._latency[stage] = seconds if prev is None else (1 - EWMA_ALPHA) * prev + EWMA_ALPHA * seconds
+
+    def estimated_savings(self, decision: RouteDecision, escalated: bool) -> float:
+        """Seconds saved versus always retrieving and always using the strong model."""
+        with self._lock:
+            saved = 0.0
+            if not decision.retrieve:
+                saved += self._latency.get("retrieve", 0.0)
+            if decision.model == self.fast_model and not escalated:
+                saved += self._latency.get(f"llm:{self.strong_model}", 0.0) - self._latency.get(
+                    f"llm:{self.fast_model}", 0.0)
+            return saved
+
+    def log(self, question: str, decision: RouteDecision, escalated: bool, elapsed: float):
+        saved = self.estimated_savings(decision, escalated)
+        record = {"ts": time.time(), "question": question[:200], **asdict(decision),
+                  "escalated": escalated, "elapsed_sec": round(elapsed, 3), "saved_sec": round(saved, 3)}
+        print(f" 🧭 Route: retrieve={decision.retrieve} model={decision.model} "
+              f"({decision.reason}){' → escalated' if escalated else ''} | saved ~{saved:.2f}s")
+        try:
+            parent = os.path.dirname(self.log_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"⚠️ Router log write failed: {e}")
@@ -0,0 +1,63 @@
+# singleflight.py
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+
+def normalize_text(text: str) -> str:
+    """Collapse runs of whitespace so trivially different inputs share a key."""
+    return " ".join(text.split())
+
+
+class SingleFlight:
+    """Collapses concurrent identical calls into one upstream call.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait on the same future and receive its result (or exception).
+    Nothing is cached once the call completes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            fut = self._in_flight.get(key)
+            if fut is not None:
+                self.collapsed += 1
+                leader = False
+            else:
+                fut = Future()
+                self._in_flight[key] = fut
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            return fut.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._in_flight.pop(key, None)
+        fut.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "collapsed": self.collapsed,
+                "in_flight": len(self._in_flight),
+            }
@@ -0,0 +1,48 @@
+# storage.py - shared helpers for the local SQLite stores
+import os
+import sqlite3
+import threading
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
+
+# Every module that reads settings at import time imports this one first, so .env applies to them all
+if load_dotenv:
+    load_dotenv()
+
+DATA_DIR = os.getenv("YCOTES_DATA_DIR", ".ycotes")
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a WAL-mode SQLite connection, creating the parent directory if needed."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteStore:
+    """Base for the local stores: one connection per thread, schema applied on first open."""
+
+    row_factory = None
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(schema)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_sqlite(self.path)
+            if self.row_factory is not None:
+                conn.row_factory = self.row_factory
+            self._local.conn = conn
+        return conn
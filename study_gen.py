@@ -0,0 +1,302 @@
+# study_gen.py - Map-reduce generation of notes, summaries and quizzes over a document's chunks
+import os
+import time
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from storage import DATA_DIR, SQLiteStore
+
+# ---------- Config ----------
+STUDY_DB_PATH = os.getenv("YCOTES_STUDY_DB", os.path.join(DATA_DIR, "study.db"))
+PROMPT_VERSION = 2           # bump when prompts or step handling change so cached steps are not reused
+REDUCE_FANOUT = 6            # partial outputs merged per reduce call
+MAX_ATTEMPTS = 3
+CHARS_PER_TOKEN = 4          # rough estimate for rate-limit accounting
+QUIZ_MAX_QUESTIONS = 15
+
+KINDS = ("notes", "summary", "quiz")
+# Kinds merged one level only: each group of REDUCE_FANOUT consecutive partials (a section of the
+# document) is merged, and the merged sections are joined in order rather than squeezed into one call
+JOINED_KINDS = ("notes",)
+
+MAP_PROMPTS = {
+    "notes": "Write lecture notes for this excerpt as markdown: a short heading, then bullet points covering "
+             "key concepts, definitions, formulas and examples. Do not add facts that are not in the excerpt.",
+    "summary": "Summarize this excerpt in 3-5 sentences, keeping the key ideas and terms.",
+    "quiz": "Write 3 multiple-choice questions that test understanding of this excerpt. Format each as:\n"
+            "Q: <question>\nA) ...\nB) ...\nC) ...\nD) ...\nAnswer: <letter>",
+}
+REDUCE_PROMPTS = {
+    "notes": "Merge these partial lecture notes into one organised set of markdown notes. Keep the topics in "
+             "their original order, remove repetition, and keep every definition and formula.",
+    "summary": "Combine these partial summaries, which are in document order, into one coherent summary of "
+               "at most three paragraphs.",
+    "quiz": f"From these draft questions, drop duplicates and keep at most {QUIZ_MAX_QUESTIONS} that best cover "
+            "the material. Keep the exact Q / A) - D) / Answer format.",
+}
+MAP_MAX_TOKENS = {"notes": 500, "summary": 200, "quiz": 400}
+REDUCE_MAX_TOKENS = {"notes": 3000, "summary": 600, "quiz": 1500}   # notes: room for REDUCE_FANOUT map outputs
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS step_cache (
+    key TEXT PRIMARY KEY,
+    output TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artifacts (
+    source TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    content TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (source, kind, lang)
+);
+"""
+
+# complete(system_prompt, user_prompt, model, max_tokens) -> (text, tokens_in, tokens_out)
+# Raises OutputTruncated when the model stopped at max_tokens.
+Completion = Callable[[str, str, str, int], Tuple[str, int, int]]
+
+
+class OutputTruncated(Exception):
+    """The completion hit its token limit, so its text is cut off."""
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _lang_instruction(lang: str) -> str:
+    return "Write in Hindi using Devanagari script." if lang == "hi" else "Write in English."
+
+
+@dataclass
+class GenerationStats:
+    chunks: int = 0
+    map_calls: int = 0
+    map_cached: int = 0
+    reduce_calls: int = 0
+    reduce_cached: int = 0
+    failed: int = 0
+    from_artifact: bool = False
+    elapsed_sec: float = 0.0
+
+
+# ---------- Rate limiting ----------
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget shared by all worker threads."""
+
+    def __init__(self, requests_per_min: int, tokens_per_min: int):
+        self.rpm = max(1, requests_per_min)
+        self.tpm = max(1, tokens_per_min)
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._updated = now
+                self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+                self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait = max((1 - self._requests) * 60.0 / self.rpm, (tokens - self._tokens) * 60.0 / self.tpm)
+            time.sleep(min(max(wait, 0.01), 5.0))
+
+
+# ---------- Persistence ----------
+class StudyStore(SQLiteStore):
+    """Per-step output cache (keyed by content hash) and finished artifacts."""
+
+    def __init__(self, path: str = STUDY_DB_PATH):
+        super().__init__(path, SCHEMA)
+
+    def get_step(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT output FROM step_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_step(self, key: str, output: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO step_cache (key, output, created_at) VALUES (?, ?, ?)",
+                         (key, output, time.time()))
+
+    def get_artifact(self, source: str, kind: str, lang: str) -> Optional[Dict]:
+        row = self._conn().execute(
+            "SELECT fingerprint, content, chunks, created_at FROM artifacts WHERE source = ? AND kind = ? AND lang = ?",
+            (source, kind, lang),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"source": source, "kind": kind, "lang": lang, "fingerprint": row[0], "content": row[1],
+                "chunks": row[2], "created_at": row[3]}
+
+    def put_artifact(self, source: str, kind: str, lang: str, fingerprint: str, content: str, chunks: int):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (source, kind, lang, fingerprint, content, chunks, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, kind, lang, fingerprint, content, chunks, time.time()),
+            )
+
+
+# ---------- Generator ----------
+class StudyGenerator:
+    """Map each chunk to a partial output in parallel, then merge partials REDUCE_FANOUT at a time.
+
+    Every map and reduce step is cached by a hash of its inputs, so after a small
+    edit only the changed chunks (and the reduce groups containing them) are redone.
+    """
+
+    def __init__(self, complete: Completion, map_model: str, reduce_model: str, workers: int = 8,
+                 limiter: Optional[RateLimiter] = None, store: Optional[StudyStore] = None):
+        self.complete = complete
+        self.map_model = map_model
+        self.reduce_model = reduce_model
+        self.workers = max(1, workers)
+        self.limiter = limiter
+        self.store = store or StudyStore()
+
+    def generate(self, source: str, chunks: Sequence[Tuple[str, str]], kind: str = "notes", lang: str = "en",
+                 force: bool = False, on_progress: Optional[Callable[[int, int], None]] = None
+                 ) -> Tuple[str, GenerationStats]:
+        """Build (or fetch) the `kind` artifact for `chunks`, a list of (title, text) in document order."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown study material kind '{kind}' (expected one of {', '.join(KINDS)})")
+        started = time.perf_counter()
+        stats = GenerationStats()
+
+        # Identical chunks (re-uploads of the same file) are generated once
+        unique, seen = [], set()
+        for title, text in chunks:
+            h = _digest(title, text)
+            if text.strip() and h not in seen:
+                seen.add(h)
+                unique.append((h, title, text))
+        stats.chunks = len(unique)
+        if not unique:
+            return "", stats
+
+        fingerprint = _digest(str(PROMPT_VERSION), kind, lang, self.map_model, self.reduce_model,
+                              *(h for h, _, _ in unique))
+        stored = self.store.get_artifact(source, kind, lang)
+        if stored and stored["fingerprint"] == fingerprint and not force:
+            stats.from_artifact = True
+            stats.elapsed_sec = time.perf_counter() - started
+            return stored["content"], stats
+
+        lock = threading.Lock()
+        joined = kind in JOINED_KINDS
+        total_steps = len(unique) + self._reduce_steps(len(unique), single_level=joined)
+        done = 0
+
+        def step_done():
+            # Runs on the calling thread, so UI callbacks are safe
+            nonlocal done
+            done += 1
+            if on_progress:
+                on_progress(done, total_steps)
+
+        def map_one(item) -> Optional[str]:
+            h, title, text = item
+            key = _digest(str(PROMPT_VERSION), "map", kind, lang, self.map_model, h)
+            user = f"Section: {title}\n\n{text}"
+            return self._step(key, MAP_PROMPTS[kind], lang, user, self.map_model, MAP_MAX_TOKENS[kind],
+                              stats, "map", lock)
+
+        def reduce_one(parts: List[str]) -> str:
+            if len(parts) == 1:
+                return parts[0]
+            key = _digest(str(PROMPT_VERSION), "reduce", kind, lang, self.reduce_model, *parts)
+            user = "\n\n---\n\n".join(f"Part {i}:\n{p}" for i, p in enumerate(parts, 1))
+            out = self._step(key, REDUCE_PROMPTS[kind], lang, user, self.reduce_model, REDUCE_MAX_TOKENS[kind],
+                             stats, "reduce", lock)
+            if out is None:
+                # A failed merge keeps its inputs rather than losing that part of the document, but the
+                # result is not final and must not be stored as the artifact
+                with lock:
+                    stats.failed += 1
+                return "\n\n".join(parts)
+            return out
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="study-gen") as pool:
+            partials = [p for p in self._map(pool, map_one, unique, step_done) if p]
+            stats.failed = len(unique) - len(partials)
+            while len(partials) > 1:
+                groups = [partials[i:i + REDUCE_FANOUT] for i in range(0, len(partials), REDUCE_FANOUT)]
+                partials = self._map(pool, reduce_one, groups, step_done)
+                if joined:
+                    break
+
+        content = "\n\n".join(partials)
+        if content and not stats.failed:
+            self.store.put_artifact(source, kind, lang, fingerprint, content, len(unique))
+        stats.elapsed_sec = time.perf_counter() - started
+        return content, stats
+
+    @staticmethod
+    def _map(pool: ThreadPoolExecutor, fn, items: Sequence, on_done: Callable[[], None]) -> List:
+        # Each task gets its own copy of the caller's context so cost attribution follows the work
+        futures = [pool.submit(contextvars.copy_context().run, fn, item) for item in items]
+        for _ in as_completed(futures):
+            on_done()
+        return [f.result() for f in futures]
+
+    @staticmethod
+    def _reduce_steps(n: int, single_level: bool = False) -> int:
+        steps = 0
+        while n > 1:
+            n = -(-n // REDUCE_FANOUT)
+            steps += n
+            if single_level:
+                break
+        return steps
+
+    def _step(self, key: str, instruction: str, lang: str, user: str, model: str, max_tokens: int,
+              stats: GenerationStats, stage: str, lock: threading.Lock) -> Optional[str]:
+        cached = self.store.get_step(key)
+        if cached is not None:
+            with lock:
+                setattr(stats, f"{stage}_cached", getattr(stats, f"{stage}_cached") + 1)
+            return cached
+
+        system = f"You are Ycotes, an AI tutor preparing study material. {instruction} {_lang_instruction(lang)}"
+        for attempt in range(MAX_ATTEMPTS):
+            if self.limiter:
+                self.limiter.acquire((len(system) + len(user)) // CHARS_PER_TOKEN + max_tokens)
+            try:
+                text, _, _ = self.complete(system, user, model, max_tokens)
+                break
+            except OutputTruncated:
+                # Retrying would be cut off the same way; a failed step is never cached
+                print(f"⚠️ Study {stage} step output exceeded {max_tokens} tokens")
+                return None
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    print(f"⚠️ Study {stage} step failed: {e}")
+                    return None
+                time.sleep(2 ** attempt)
+        with lock:
+            setattr(stats, f"{stage}_calls", getattr(stats, f"{stage}_calls") + 1)
+        text = text.strip()
+        if text:
+            self.store.put_step(key, text)
+        return text or None
@@ -0,0 +1,82 @@
+# tabular_ingest.py - Row-streaming chunker for CSV / TSV files
+import os
+import csv
+import sys
+from typing import Dict, Iterator, List
+
+TABULAR_EXTENSIONS = (".csv", ".tsv")
+TABLE_CHUNK_TOKENS = 800    # target size of one chunk, header included
+CHARS_PER_TOKEN = 4         # rough estimate; avoids a tokenizer dependency
+SNIFF_BYTES = 64 * 1024
+
+# Rows can hold very long text cells (e.g. question banks)
+csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+
+
+def is_tabular(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in TABULAR_EXTENSIONS
+
+
+def _dialect_and_header(f, filepath: str):
+    sample = f.read(SNIFF_BYTES)
+    f.seek(0)
+    fallback = csv.excel_tab if filepath.lower().endswith(".tsv") else csv.excel
+    try:
+        sniffer = csv.Sniffer()
+        dialect = sniffer.sniff(sample, delimiters=",\t;|")
+        has_header = sniffer.has_header(sample)
+    except csv.Error:
+        dialect, has_header = fallback, True
+    return dialect, has_header
+
+
+def iter_table_chunks(filepath: str, max_tokens: int = TABLE_CHUNK_TOKENS) -> Iterator[Dict[str, str]]:
+    """Lazily group rows into token-bounded chunks, repeating the header in each one.
+
+    Only one chunk's worth of rows is held in memory at a time.
+    """
+    name = os.path.basename(filepath)
+    budget = max_tokens * CHARS_PER_TOKEN
+    with open(filepath, "r", encoding="utf-8-sig", errors="ignore", newline="") as f:
+        dialect, has_header = _dialect_and_header(f, filepath)
+        reader = csv.reader(f, dialect)
+        first = next(reader, None)
+        if first is None:
+            return
+        if has_header:
+            header = [h.strip() or f"column_{i + 1}" for i, h in enumerate(first)]
+            pending_first: List[List[str]] = []
+        else:
+            header = [f"column_{i + 1}" for i in range(len(first))]
+            pending_first = [first]
+        header_line = "Columns: " + " | ".join(header)
+        row_budget = max(1, budget - len(header_line))
+
+        lines: List[str] = []
+        size = 0
+        first_row = 1
+
+        def flush(last_row: int) -> Dict[str, str]:
+            return {
+                "title": f"{name} rows {first_row}-{last_row}",
+                "content": header_line + "\n" + "\n".join(lines),
+            }
+
+        row_no = 0
+        for row in _chain(pending_first, reader):
+            if not any(cell.strip() for cell in row):
+                continue
+            row_no += 1
+            line = " | ".join(cell.strip() for cell in row)[:row_budget]
+            if lines and size + len(line) + 1 > row_budget:
+                yield flush(row_no - 1)
+                lines, size, first_row = [], 0, row_no
+            lines.append(line)
+            size += len(line) + 1
+        if lines:
+            yield flush(row_no)
+
+
+def _chain(first_rows: List[List[str]], reader) -> Iterator[List[str]]:
+    yield from first_rows
+    yield from reader
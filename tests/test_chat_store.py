@@ -0,0 +1,34 @@
+# tests/test_chat_store.py - ChatStore batched writes and turn paging
+from chat_store import ChatStore
+
+
+def test_load_turns_pages_same_timestamp_turns(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.db"))
+    session = store.create_session()
+    for i in range(5):
+        store.append_turn(session, {"role": "user", "content": f"turn {i}", "timestamp": 100.0})
+    store.flush()
+
+    page, has_more = store.load_turns(session, limit=3)
+    assert [t["content"] for t in page] == ["turn 2", "turn 3", "turn 4"]
+    assert has_more
+
+    page, has_more = store.load_turns(session, before_id=page[0]["id"], limit=3)
+    assert [t["content"] for t in page] == ["turn 0", "turn 1"]
+    assert not has_more
+    assert store.turn_id(session, 100.0) == page[0]["id"]
+    store.close()
+
+
+def test_one_bad_write_does_not_drop_its_batch(tmp_path):
+    store = ChatStore(str(tmp_path / "chat.db"))
+    session = store.create_session()
+    store.append_turn(session, {"role": "user", "content": "before"})
+    store._enqueue("INSERT INTO turns (session_id, role, content, timestamp) VALUES (?, ?, ?, ?)",
+                   (session, None, "bad", 1.0))
+    store.append_turn(session, {"role": "assistant", "content": "after"})
+    store.flush()
+
+    turns, _ = store.load_turns(session)
+    assert [t["content"] for t in turns] == ["before", "after"]
+    store.close()
@@ -0,0 +1,151 @@
+# tests/test_crawler.py - SiteCrawler against a local HTTP server
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("lxml")
+pytest.importorskip("requests")
+
+from crawler import SiteCrawler  # noqa: E402
+
+PAGES = {
+    "/": '<a href="/a">A</a> <a href="/b">B</a> <a href="/c">C</a> <a href="/private">P</a>',
+    "/a": "<p>Page A</p>",
+    "/b": "<p>Page B</p>",
+    "/c": "<p>Page C</p>",
+    "/private": "<p>Not for crawlers</p>",
+}
+ROBOTS = "User-agent: *\nDisallow: /private\n"
+
+
+REDIRECT_PAGES = {
+    "/": '<a href="/moved">Moved</a> <a href="/away">Away</a>',
+    "/docs/": '<a href="intro">Intro</a>',
+    "/docs/intro": "<p>Docs intro</p>",
+    "/intro": "<p>Wrong intro</p>",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    pages = PAGES
+
+    def do_GET(self):
+        if self.path == "/robots.txt":
+            return self._send(200, ROBOTS.encode(), "text/plain")
+        if self.path == "/moved":
+            return self._redirect("/docs/")
+        if self.path == "/away":
+            # Same server under another host name: outside the crawl's scope
+            return self._redirect(f"http://localhost:{self.server.server_address[1]}/a")
+        html = self.pages.get(self.path)
+        if html is None:
+            return self._send(404, b"", "text/plain")
+        body = f"<html><body>{html}</body></html>".encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self._send(200, body, "text/html; charset=utf-8", etag)
+
+    def _redirect(self, location):
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if etag:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+@pytest.fixture
+def site():
+    server, url = serve(Handler)
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def redirect_site():
+    server, url = serve(type("RedirectHandler", (Handler,), {"pages": REDIRECT_PAGES}))
+    yield url
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(site, cache_dir, on_page=None):
+    pages = []
+
+    def collect(page):
+        pages.append(page)
+        return on_page(page) if on_page else page.changed
+
+    stats = SiteCrawler(site, max_depth=1, cache_dir=str(cache_dir)).crawl(collect)
+    return stats, pages
+
+
+def test_recrawl_gets_not_modified(site, tmp_path):
+    stats, pages = crawl(site, tmp_path)
+    assert (stats.fetched, stats.not_modified, stats.blocked_by_robots) == (4, 0, 1)
+    assert all(p.changed for p in pages)
+    assert not any("/private" in p.url for p in pages)
+
+    stats, pages = crawl(site, tmp_path)
+    assert (stats.fetched, stats.not_modified, stats.blocked_by_robots) == (0, 4, 1)
+    assert not any(p.changed for p in pages)
+    assert any("Page A" in p.text for p in pages)
+
+
+def test_failed_ingest_is_not_cached(site, tmp_path):
+    def fail_on_b(page):
+        if page.url.endswith("/b"):
+            raise RuntimeError("upsert failed")
+        return True
+
+    stats, _ = crawl(site, tmp_path, fail_on_b)
+    assert (stats.fetched, stats.errors) == (4, 1)
+
+    stats, pages = crawl(site, tmp_path)
+    assert (stats.fetched, stats.not_modified) == (1, 3)
+    assert [p.url for p in pages if p.changed] == [site + "b"]
+
+
+def test_reingested_page_restarts_ttl(site, tmp_path):
+    crawl(site, tmp_path)
+    _, first = crawl(site, tmp_path, lambda page: True)
+    time.sleep(0.01)
+    _, second = crawl(site, tmp_path)
+    before = {p.url: p.fetched_at for p in first}
+    assert all(p.fetched_at > before[p.url] for p in second)
+
+
+def test_redirects_resolve_links_and_stay_in_scope(redirect_site, tmp_path):
+    pages = []
+    stats = SiteCrawler(redirect_site, max_depth=2, cache_dir=str(tmp_path)).crawl(
+        lambda page: pages.append(page) or True)
+    texts = [p.text for p in pages]
+    assert "Docs intro" in texts
+    assert "Wrong intro" not in texts and "Page A" not in texts
+    assert stats.skipped == 1
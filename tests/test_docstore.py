@@ -0,0 +1,49 @@
+# tests/test_docstore.py - DocStore generations, expiry and duplicate pointers
+from docstore import DocStore
+
+
+def chunk(vec_id, text, doc="a.pdf", created_at=1.0, **extra):
+    return {"id": vec_id, "source": "course", "doc": doc, "title": vec_id, "text": text,
+            "created_at": created_at, **extra}
+
+
+def texts(store, now=10.0):
+    return [row["text"] for row in store.iter_source("course", now=now)]
+
+
+def test_iter_source_reads_latest_generation_in_order(tmp_path):
+    store = DocStore(str(tmp_path / "docs.db"))
+    store.put_many([chunk("a1", "old one"), chunk("a2", "old two")])
+    store.put_many([chunk("b1", "b only", doc="b.pdf", created_at=2.0)])
+    store.put_many([chunk("a3", "new one", created_at=3.0), chunk("a4", "new two " * 100, created_at=3.0)])
+    assert texts(store) == ["b only", "new one", "new two " * 100]
+
+
+def test_iter_source_keeps_untracked_rows(tmp_path):
+    store = DocStore(str(tmp_path / "docs.db"))
+    store.put_many([chunk("x1", "legacy", doc=None), chunk("a1", "tracked", created_at=2.0)])
+    assert texts(store) == ["legacy", "tracked"]
+
+
+def test_iter_source_deletes_expired_rows(tmp_path):
+    store = DocStore(str(tmp_path / "docs.db"))
+    store.put_many([chunk("a1", "kept", expires_at=20.0), chunk("a2", "gone", expires_at=5.0)])
+    assert texts(store) == ["kept"]
+    assert store.get_many(["a1", "a2"]) == {"a1": "kept"}
+
+
+def test_iter_source_follows_duplicate_pointers(tmp_path):
+    store = DocStore(str(tmp_path / "docs.db"))
+    store.put_many([chunk("c1", "shared text", doc="other.pdf", expires_at=20.0)])
+    store.put_many([chunk("a1", "own text"), chunk("a2", "", canonical_id="c1")])
+    assert texts(store) == ["shared text", "own text", "shared text"]
+
+    # Once the canonical chunk expires its pointer rows read as nothing
+    assert texts(store, now=30.0) == ["own text"]
+
+
+def test_extend_expiry(tmp_path):
+    store = DocStore(str(tmp_path / "docs.db"))
+    store.put_many([chunk("a1", "one", expires_at=5.0), chunk("a2", "two", expires_at=5.0)])
+    store.extend_expiry(["a1"], None)
+    assert texts(store) == ["one"]
@@ -0,0 +1,48 @@
+# tests/test_embed_batcher.py - EmbeddingBatcher batching and failure isolation
+import threading
+
+import pytest
+
+from embed_batcher import EmbeddingBatcher
+
+
+class FakeEmbedder:
+    """Embeds a text as [len(text)]; fails the whole call if any text contains "bad"."""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        if any("bad" in t for t in texts):
+            raise RuntimeError("invalid input")
+        return [[float(len(t))] for t in texts], sum(len(t) for t in texts)
+
+
+def test_requests_in_one_window_share_a_call():
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=200)
+    futures = [batcher.submit(t) for t in ("a", "bb", "cccc")]
+    assert [f.result(timeout=5) for f in futures] == [([1.0], 1), ([2.0], 2), ([4.0], 4)]
+    assert embedder.calls == [["a", "bb", "cccc"]]
+
+
+def test_bad_input_fails_only_its_own_request():
+    embedder = FakeEmbedder()
+    batcher = EmbeddingBatcher(embedder, window_ms=200)
+    futures = [batcher.submit(t) for t in ("one", "bad", "three")]
+    assert futures[0].result(timeout=5)[0] == [3.0]
+    assert futures[2].result(timeout=5)[0] == [5.0]
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=5)
+    assert embedder.calls == [["one", "bad", "three"], ["one"], ["bad"], ["three"]]
+
+
+@pytest.mark.parametrize("text", ["", "   \n"])
+def test_empty_text_is_rejected(text):
+    embedder = FakeEmbedder()
+    with pytest.raises(ValueError):
+        EmbeddingBatcher(embedder).submit(text)
+    assert embedder.calls == []
@@ -0,0 +1,92 @@
+# tests/test_local_index.py - QuantizedIndex search and the snapshot export / load / restore round-trip
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from docstore import DocStore  # noqa: E402
+from index_snapshot import export_snapshot, load_snapshot, restore_snapshot  # noqa: E402
+from local_index import QuantizedIndex  # noqa: E402
+
+DIM = 16
+
+
+def random_vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+class FakeIndex:
+    """The slice of the Pinecone index API the snapshot code uses (v2-style dict responses)."""
+
+    def __init__(self):
+        self.namespaces = {}
+
+    def list(self, namespace):
+        ids = list(self.namespaces.get(namespace, {}))
+        for start in range(0, len(ids), 7):
+            yield ids[start:start + 7]
+
+    def fetch(self, ids, namespace):
+        stored = self.namespaces.get(namespace, {})
+        return {"vectors": {i: {"values": stored[i][0], "metadata": stored[i][1]} for i in ids if i in stored}}
+
+    def upsert(self, vectors, namespace):
+        for vec_id, values, metadata in vectors:
+            self.namespaces.setdefault(namespace, {})[vec_id] = (list(values), dict(metadata))
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_search_finds_the_query_vector(quantization):
+    vectors = random_vectors(200)
+    ids = [f"v{i}" for i in range(200)]
+    idx = QuantizedIndex(ids, vectors, quantization=quantization, oversample=8)
+    for row in (0, 57, 199):
+        matches = idx.search(vectors[row], top_k=5)
+        assert matches[0]["id"] == ids[row]
+        assert matches[0]["score"] == pytest.approx(1.0, abs=1e-5)
+        assert [m["score"] for m in matches] == sorted((m["score"] for m in matches), reverse=True)
+
+
+def test_search_skips_expired_and_masked_rows():
+    vectors = random_vectors(10)
+    metadata = [{"expires_at": 100.0} if i == 3 else {} for i in range(10)]
+    idx = QuantizedIndex([f"v{i}" for i in range(10)], vectors, metadata)
+    assert "v3" not in [m["id"] for m in idx.search(vectors[3], top_k=10, now=200.0)]
+    assert idx.search(vectors[3], top_k=1, now=50.0)[0]["id"] == "v3"
+
+    mask = np.zeros(10, dtype=bool)
+    mask[[1, 2]] = True
+    assert {m["id"] for m in idx.search(vectors[3], top_k=10, now=50.0, mask=mask)} == {"v1", "v2"}
+
+
+def test_snapshot_round_trip(tmp_path):
+    vectors = random_vectors(20, seed=1)
+    source = FakeIndex()
+    source.upsert([(f"c{i}", vectors[i], {"source": "notes.pdf", "section_id": f"s{i // 5}"}) for i in range(20)], "kb")
+    source.upsert([(f"s{i}", vectors[i * 5], {"n_chunks": 5}) for i in range(4)], "kb-sections")
+    docs = DocStore(str(tmp_path / "docs.db"))
+    docs.put_many([{"id": f"c{i}", "source": "notes.pdf", "text": f"chunk {i}"} for i in range(20)])
+    docs.put_many([{"id": "dup", "source": "copy.pdf", "text": "", "canonical_id": "c4"}])
+
+    snapshot = str(tmp_path / "snap")
+    manifest = export_snapshot(source, snapshot, "kb", "test-model", DIM, docstore=docs,
+                               section_namespace="kb-sections")
+    assert manifest["count"] == 20
+
+    local = load_snapshot(snapshot, expected_model="test-model", expected_dimension=DIM)
+    match = local.search(vectors[7], top_k=1)[0]
+    assert (match["id"], match["metadata"]["section_id"]) == ("c7", "s1")
+    with pytest.raises(ValueError):
+        load_snapshot(snapshot, expected_model="other-model")
+
+    target = FakeIndex()
+    restored_docs = str(tmp_path / "restored.db")
+    assert restore_snapshot(target, snapshot, "kb", "test-model", DIM, section_namespace="kb-sections",
+                            docstore_path=restored_docs) == 20
+    assert set(target.namespaces["kb"]) == set(source.namespaces["kb"])
+    assert target.namespaces["kb-sections"]["s2"][1] == {"n_chunks": 5}
+    values, metadata = target.namespaces["kb"]["c7"]
+    assert np.allclose(values, vectors[7] / np.linalg.norm(vectors[7]), atol=1e-6)
+    assert metadata == {"source": "notes.pdf", "section_id": "s1"}
+    restored = DocStore(restored_docs)
+    assert restored.get_many(["c7", "dup"]) == {"c7": "chunk 7", "dup": ""}
+    assert [row["text"] for row in restored.iter_source("copy.pdf")] == ["chunk 4"]